@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+'''
+Microbenchmark of the outbound and inbound buffers.
+
+A steady stream of frames is appended and consumed, while the buffer
+never fully drains. The old BytesIO-with-offset buffer is included for
+comparison; it copies the unread data on every read and only frees
+memory when fully drained.
+'''
+
+from __future__ import print_function
+
+import io
+import os
+import socket
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from puka import simplebuffer
+
+
+class BytesIOBuffer(object):
+    # The buffer puka used before ChunkedBuffer.
+    def __init__(self):
+        self.buf = io.BytesIO()
+        self.size = self.offset = 0
+
+    def write(self, data):
+        self.buf.write(data)
+        self.size += len(data)
+
+    def read(self, size=None):
+        self.buf.seek(self.offset)
+        data = self.buf.read() if size is None else self.buf.read(size)
+        self.buf.seek(0, os.SEEK_END)
+        return data
+
+    def consume(self, size):
+        self.offset += size
+        self.size -= size
+        if self.size == 0 and self.offset > 524288:
+            self.buf = io.BytesIO()
+            self.offset = 0
+
+    def retained(self):
+        return len(self.buf.getbuffer())
+
+
+def bench_send(buf, frame, iterations, backlog):
+    for i in range(backlog):
+        buf.write(frame)
+    t0 = time.time()
+    # What on_write() does: look at the head, drop what was sent.
+    if hasattr(buf, 'iovec'):
+        head = buf.iovec
+    else:
+        head = lambda: buf.read(128*1024)
+    for i in range(iterations):
+        buf.write(frame)
+        head()
+        buf.consume(len(frame))
+    return time.time() - t0
+
+
+def bench_recv(frame, iterations):
+    a, b = socket.socketpair()
+    rb = simplebuffer.RecvBuffer()
+    t0 = time.time()
+    for i in range(iterations):
+        b.sendall(frame)
+        rb.recv_into(a, 131072)
+        view = rb.view()
+        rb.consume(len(view))
+        view.release() if hasattr(view, 'release') else None
+    td = time.time() - t0
+    a.close()
+    b.close()
+    return td
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    for size in (64, 1024, 16384):
+        frame = os.urandom(size)
+        for name, buf in (('bytesio', BytesIOBuffer()),
+                          ('chunked', simplebuffer.ChunkedBuffer())):
+            td = bench_send(buf, frame, iterations, backlog=64)
+            extra = ''
+            if hasattr(buf, 'retained'):
+                extra = ', %.1f MB retained' % (buf.retained() / 1048576.0)
+            print('send %-8s %6i B frames: %9.0f frames/s%s' % (
+                name, size, iterations / td, extra))
+        td = bench_recv(frame, iterations)
+        print('recv %-8s %6i B frames: %9.0f frames/s' % (
+            'recvbuf', size, iterations / td))
+
+
+if __name__ == '__main__':
+    main()
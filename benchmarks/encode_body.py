@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+'''
+Microbenchmark of splitting a message body into frames.
+
+puka used to cut the body with body[:limit], body[limit:], copying the
+rest of the body for every frame, quadratic in the body size. Frames
+are now views into the body. The old way is only timed up to 16MB, it
+takes far too long beyond that.
+'''
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from puka import spec
+
+
+FRAME_MAX = 131072
+
+
+def encode_body_old(body, frame_size):
+    limit = frame_size - 7 - 1
+    r = []
+    while body:
+        payload, body = body[:limit], body[limit:]
+        r.append( (0x03, payload) )
+    return r
+
+
+def timeit(encode, body):
+    t0 = time.time()
+    frames = encode(body, FRAME_MAX)
+    td = time.time() - t0
+    assert sum(len(payload) for _, payload in frames) == len(body)
+    return td
+
+
+def main():
+    max_size = int(sys.argv[1]) if len(sys.argv) > 1 else 1 << 30
+    size = 1024
+    while size <= max_size:
+        body = bytes(size)
+        new = timeit(spec.encode_body, body)
+        if size <= 16 << 20:
+            old = '%9.4fs' % timeit(encode_body_old, body)
+        else:
+            old = '%10s' % '-'
+        print('%10i B body: old %s, views %9.6fs, %8.1f ns/KB' % (
+            size, old, new, new * 1e9 / (size / 1024.0)))
+        del body
+        size *= 4
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+'''
+Microbenchmark of the inbound frame parser.
+
+A byte stream of deliveries (method, header and body frame each) is
+recorded once and then parsed over and over, the way on_read() does
+with a full receive buffer. The frame-at-a-time parser puka used
+before is included for comparison.
+'''
+
+from __future__ import print_function
+
+import os
+import struct
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from puka import connection
+from puka import spec
+
+
+class Channel(object):
+    def __init__(self):
+        self.count = 0
+
+    def inbound_method(self, frame):
+        self.count += 1
+
+    def inbound_props(self, body_size, props):
+        self.count += 1
+
+    def inbound_body(self, body_chunk):
+        self.count += 1
+
+
+def shortstr(s):
+    return struct.pack('!B', len(s)) + s
+
+
+def frame(frame_type, payload):
+    return struct.pack('!BHI', frame_type, 1, len(payload)) + payload + \
+        b'\xCE'
+
+
+def record(count, body_size):
+    delivery = b''.join([
+        frame(0x01, struct.pack('!I', spec.METHOD_BASIC_DELIVER) +
+              shortstr(b'ctag') + struct.pack('!QB', 1, 0) +
+              shortstr(b'') + shortstr(b'routing.key')),
+        frame(0x02, struct.pack('!HHQH', 60, 0, body_size, 0)),
+        frame(0x03, b'x' * body_size)])
+    return delivery * count
+
+
+def handle_frame_read(conn, data, start_offset):
+    # The parser puka used before, one frame per call.
+    offset = start_offset
+    if len(data)-start_offset < 8:
+        return start_offset, 8
+    frame_type, channel, payload_size = \
+        struct.unpack_from('!BHI', data, offset)
+    offset += 7
+    if len(data)-start_offset < 8+payload_size:
+        return start_offset, 8+payload_size
+    assert bytes([data[offset+payload_size]]) == b'\xCE'
+    if frame_type == 0x01:
+        method_id, = struct.unpack_from('!I', data, offset)
+        offset += 4
+        frame, offset = spec.METHODS[method_id](data, offset)
+        conn.channels.channels[channel].inbound_method(frame)
+    elif frame_type == 0x02:
+        (class_id, body_size) = struct.unpack_from('!HxxQ', data, offset)
+        offset += 12
+        props, offset = spec.PROPS[class_id](data, offset)
+        conn.channels.channels[channel].inbound_props(body_size, props)
+    elif frame_type == 0x03:
+        body_chunk = data[offset:offset+payload_size].tobytes()
+        conn.channels.channels[channel].inbound_body(body_chunk)
+        offset += len(body_chunk)
+    offset += 1
+    assert offset == start_offset+8+payload_size
+    return offset, 8
+
+
+def parse_old(conn, data):
+    offset, need = 0, 8
+    while len(data) - offset >= need and conn.sd is not None:
+        offset, need = handle_frame_read(conn, data, offset)
+    return offset
+
+
+def parse_new(conn, data):
+    offset, frames, need = conn._handle_frames(data, 0)
+    return offset
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    conn = connection.Connection()
+    conn.sd = True
+    channel = conn.channels.channels[1] = Channel()
+    for body_size in (16, 1024, 65536):
+        data = memoryview(record(100000 // (1 + body_size // 1024),
+                                 body_size))
+        for name, parse in (('old', parse_old), ('batched', parse_new)):
+            channel.count = 0
+            t0 = time.time()
+            for i in range(rounds):
+                assert parse(conn, data) == len(data)
+            td = time.time() - t0
+            print('%-8s %6i B bodies: %9.0f frames/s, %7.1f MB/s' % (
+                name, body_size, channel.count / td,
+                len(data) * rounds / td / 1048576.0))
+
+
+if __name__ == '__main__':
+    main()
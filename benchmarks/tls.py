@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+'''
+Throughput of publishing and consuming over plain TCP and over TLS,
+against a real broker. The plaintext url is taken from AMQP_URL, the
+TLS one from AMQPS_URL:
+
+    AMQP_URL=amqp:/// AMQPS_URL=amqps:/// benchmarks/tls.py [count]
+
+Messages are published to a fresh queue and consumed back with
+no_ack, the rates are in MB of message bodies per second.
+'''
+
+from __future__ import print_function
+
+import os
+import random
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import puka
+
+
+def bench(url, size, count):
+    client = puka.Client(url)
+    client.wait(client.connect())
+    queue = 'bench%s' % (random.random(),)
+    client.wait(client.queue_declare(queue=queue, auto_delete=True))
+    body = os.urandom(size)
+
+    t0 = time.time()
+    with client.corked():
+        for i in range(count):
+            client.basic_publish(exchange='', routing_key=queue, body=body)
+    client.wait(client.basic_publish(exchange='', routing_key=queue,
+                                     body=body))
+    t1 = time.time()
+
+    consume_promise = client.basic_consume(queue=queue, no_ack=True,
+                                           prefetch_count=1000)
+    for i in range(count + 1):
+        client.wait(consume_promise)
+    t2 = time.time()
+
+    client.wait(client.basic_cancel(consume_promise))
+    client.wait(client.close())
+    mb = size * (count + 1) / 1048576.0
+    return mb / (t1 - t0), mb / (t2 - t1)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    urls = (('plain', os.getenv('AMQP_URL', 'amqp:///')),
+            ('tls', os.getenv('AMQPS_URL', 'amqps:///')))
+    for size in (128, 4096, 65536, 1048576):
+        n = max(10, count * 128 // max(size, 1024))
+        for name, url in urls:
+            publish, consume = bench(url, size, n)
+            print('%-5s %8i B bodies: publish %8.1f MB/s, '
+                  'consume %8.1f MB/s' % (name, size, publish, consume))
+
+
+if __name__ == '__main__':
+    main()
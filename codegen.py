@@ -165,6 +165,7 @@ def print_encode_method(m):
             fields.do_print(' ' * 16, '%s')
         print("           ), )")
     else:
+        print("    body = as_bytes(body)")
         print("    return [ (0x01,")
         print("              join_as_bytes((")
         fields.do_print(' ' * 16, '%s')
@@ -278,7 +279,7 @@ from struct import pack, unpack_from
 import future.utils as futils
 
 from . import table
-from .compat import as_str, join_as_bytes
+from .compat import as_bytes, as_str, join_as_bytes
 
 """)
     print("PREAMBLE = b'AMQP\\x00\\x%02x\\x%02x\\x%02x'" % (
@@ -330,11 +331,11 @@ def split_headers(user_headers, properties_set):
 
 def encode_body(body, frame_size):
     limit = frame_size - 7 - 1   # spec is broken...
-    r = []
-    while body:
-        payload, body = body[:limit], body[limit:]
-        r.append( (0x03, payload) )
-    return r
+    if len(body) <= limit:
+        return [(0x03, body)] if len(body) else []
+    # Frames are views into the body, slicing bytes would copy.
+    view = memoryview(body)
+    return [(0x03, view[i:i + limit]) for i in range(0, len(view), limit)]
 """, end="")
 
 
@@ -3,5 +3,5 @@ from __future__ import absolute_import
 from .client import Client
 from .connection import SslConnectionParameters
 from .spec_exceptions import *
-from .exceptions import ConnectionBroken
-from .poll import loop
+from .exceptions import ConnectionBroken, PromiseTimeout, WouldBlock
+from .poll import loop, Hub
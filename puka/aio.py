@@ -0,0 +1,260 @@
+'''
+asyncio integration, Python 3 only.
+
+AsyncClient plugs the connection socket into the asyncio event loop
+with add_reader() / add_writer(). Methods that would normally return a
+promise number return an asyncio future instead, consumers are exposed
+as asynchronous iterators:
+
+    client = AsyncClient('amqp:///')
+    await client.connect()
+    await client.queue_declare(queue='test')
+    await client.basic_publish(exchange='', routing_key='test', body='x')
+    async for msg in client.basic_consume(queue='test'):
+        client.basic_ack(msg)
+'''
+
+from __future__ import absolute_import
+
+import asyncio
+import functools
+import socket
+
+from . import client
+from . import exceptions
+from . import machine
+from . import spec
+
+
+class AsyncioSelector(object):
+    '''
+    Selector engine handing the descriptors to an asyncio event loop.
+    It can't be polled, the asyncio loop drives it. Handler methods are
+    called through 'run', if given.
+    '''
+    threadsafe = False
+
+    def __init__(self, loop, run=None):
+        self.loop = loop
+        self.run = run if run is not None else self._run
+        self._handlers = {}
+
+    def _run(self, method):
+        method()
+
+    def _on_read(self, handler):
+        # Looked up late, the handler may swap its methods.
+        self.run(handler.on_read)
+
+    def _on_write(self, handler):
+        self.run(handler.on_write)
+
+    def register(self, fd, handler, write=False):
+        self._handlers[fd] = handler
+        self.loop.add_reader(fd, self._on_read, handler)
+        self.modify(fd, write)
+
+    def modify(self, fd, write):
+        if write:
+            self.loop.add_writer(fd, self._on_write, self._handlers[fd])
+        else:
+            self.loop.remove_writer(fd)
+
+    def unregister(self, fd):
+        del self._handlers[fd]
+        self.loop.remove_reader(fd)
+        self.loop.remove_writer(fd)
+
+    def poll(self, timeout=None):
+        raise RuntimeError("AsyncClient is driven by the asyncio event loop, "
+                           "use 'await' instead of wait() or loop().")
+
+    def close(self):
+        pass
+
+    def __len__(self):
+        return len(self._handlers)
+
+
+def _resolve_future(future, promise_number, result):
+    if future.done():
+        # Cancelled by the user.
+        return
+    if result.is_error:
+        future.set_exception(result.exception)
+    else:
+        future.set_result(result)
+
+
+def future_decorator(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        future = self._get_loop().create_future()
+        timeout = kwargs.pop('timeout', None)
+        p = method(self, *args, **kwargs)
+        p.user_callback = functools.partial(_resolve_future, future)
+        p.after_machine()
+        if timeout is not None:
+            p.set_timeout(timeout)
+        self._aio_sync()
+        return future
+    return wrapper
+
+
+def consumer_decorator(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        timeout = kwargs.pop('timeout', None)
+        p = method(self, *args, **kwargs)
+        consumer = Consumer(self, p.number)
+        p.user_callback = consumer._push
+        p.after_machine()
+        if timeout is not None:
+            p.set_timeout(timeout)
+        self._aio_sync()
+        return consumer
+    return wrapper
+
+
+class Consumer(object):
+    '''
+    Asynchronous iterator over messages delivered to a consumer. The
+    iteration stops when the consumer gets cancelled, errors are raised
+    from the iterator.
+    '''
+    def __init__(self, client, promise_number):
+        self.client = client
+        self.promise_number = promise_number
+        self._queue = asyncio.Queue()
+        self._finished = False
+
+    def _push(self, promise_number, result):
+        if result is None or getattr(result, 'name', None) == 'basic.cancel_ok':
+            result = None
+        self._queue.put_nowait(result)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._finished:
+            raise StopAsyncIteration
+        result = await self._queue.get()
+        if result is None:
+            self._finished = True
+            raise StopAsyncIteration
+        if result.is_error:
+            self._finished = True
+            raise result.exception
+        return result
+
+    async def cancel(self):
+        '''
+        Cancel the consumer. Messages already received are still
+        returned by the iterator.
+        '''
+        result = await self.client.basic_cancel(self.promise_number)
+        self._queue.put_nowait(None)
+        return result
+
+
+class AsyncClient(client.Client):
+    '''
+    Client integrated with asyncio. Accepts the same arguments as
+    Client, plus an optional event loop.
+    '''
+    attach_methods = (future_decorator, [
+        machine.queue_declare,
+        machine.queue_purge,
+        machine.queue_delete,
+        machine.basic_publish,
+        machine.basic_cancel,
+        machine.basic_qos,
+        machine.basic_get,
+        machine.exchange_declare,
+        machine.exchange_delete,
+        machine.exchange_bind,
+        machine.exchange_unbind,
+        machine.queue_bind,
+        machine.queue_unbind,
+        ])
+
+    def __init__(self, *args, **kwargs):
+        self._loop = kwargs.pop('loop', None)
+        self._timer_handle = None
+        self._timer_at = None
+        super(AsyncClient, self).__init__(*args, **kwargs)
+
+    basic_consume = consumer_decorator(machine.basic_consume)
+    basic_consume_multi = consumer_decorator(machine.basic_consume_multi)
+
+    def _get_loop(self):
+        if self._loop is None:
+            self._loop = asyncio.get_event_loop()
+        return self._loop
+
+    @future_decorator
+    def connect(self):
+        self.selector = AsyncioSelector(self._get_loop(), self._aio_run)
+        return self._connect()
+
+    @future_decorator
+    def close(self):
+        return self._close()
+
+    def basic_ack(self, *args, **kwargs):
+        super(AsyncClient, self).basic_ack(*args, **kwargs)
+        self._aio_sync()
+
+    def basic_reject(self, *args, **kwargs):
+        super(AsyncClient, self).basic_reject(*args, **kwargs)
+        self._aio_sync()
+
+    def call_soon_threadsafe(self, callback, *args):
+        # The asyncio loop has a waker of its own.
+        self._get_loop().call_soon_threadsafe(
+            self._aio_run, functools.partial(callback, *args))
+
+    def _make_waker(self):
+        # Not needed, see call_soon_threadsafe().
+        pass
+
+    def _aio_sync(self):
+        # Callbacks may be ready straight away, for example when the
+        # connection is already broken.
+        if self.promises.ready:
+            self._get_loop().call_soon(self.run_any_callbacks)
+        self._aio_io_sync()
+
+    def _aio_io_sync(self):
+        if self._io_active():
+            self._io_sync()
+        self._aio_schedule_timers()
+
+    def _aio_schedule_timers(self):
+        # Keep a single asyncio timer armed for our nearest deadline.
+        timeout = self.timers.timeout()
+        if timeout is None:
+            return
+        loop = self._get_loop()
+        when = loop.time() + timeout
+        if self._timer_handle is not None:
+            if self._timer_at <= when:
+                return
+            self._timer_handle.cancel()
+        self._timer_at = when
+        self._timer_handle = loop.call_at(when, self._aio_timers_expired)
+
+    def _aio_timers_expired(self):
+        self._timer_handle = self._timer_at = None
+        self._aio_run(self.timers.run)
+
+    def _aio_run(self, handler):
+        try:
+            handler()
+        except socket.error as e:
+            # There is no wait() to raise the error from, fail the
+            # promises instead.
+            self._shutdown(exceptions.mark_frame(spec.Frame(), e))
+        self.run_any_callbacks()
+        self._aio_io_sync()
@@ -3,8 +3,9 @@ from builtins import range
 
 import array
 import logging
+import os
+import types
 
-from . import compat
 from . import machine
 from .spec_exceptions import ChannelError
 
@@ -62,6 +63,8 @@ class ChannelCollection(object):
 
 class Channel(object):
     alive = False
+    # Publishes on the channel get confirmed.
+    confirm = False
 
     def __init__(self, number):
         self.number = number
@@ -69,8 +72,7 @@ class Channel(object):
         self._clear_inbound_state()
 
     def _clear_inbound_state(self):
-        self.method_frame = self.props = None
-        self.body_chunks = []
+        self.method_frame = self.props = self.body = self.stream = None
         self.body_len = self.body_size = 0
 
     def inbound_method(self, frame):
@@ -82,25 +84,93 @@ class Channel(object):
     def inbound_props(self, body_size, props):
         self.body_size = body_size
         self.props = props
+        if self.promise.body_sink is not None:
+            self._start_stream()
         if self.body_size == 0: # don't expect body frame
-            self.inbound_body(b'')
+            if self.stream is not None:
+                return self._inbound_message(None)
+            if self.promise.body_view:
+                return self._inbound_message(memoryview(b''))
+            return self._inbound_message(b'')
+
+    def _start_stream(self):
+        result = self.method_frame
+        result['body_size'] = self.body_size
+        self._set_headers(result, self.props)
+        self.stream = BodyStream(self.promise.body_sink(result))
 
     def inbound_body(self, body_chunk):
-        self.body_chunks.append( body_chunk )
-        self.body_len += len(body_chunk)
+        # 'body_chunk' is a view of the receive buffer, it must be
+        # copied out, unless the promise asked for a body_view.
+        size = len(body_chunk)
+        if self.stream is not None:
+            self.stream.write(body_chunk)
+            self.body_len += size
+            if self.body_len == self.body_size:
+                return self._inbound_message(None)
+            return
+        if size == self.body_size:
+            # The whole body in a single frame.
+            if self.promise.body_view:
+                self.promise.conn.recv_buf.pin()
+                return self._inbound_message(body_chunk)
+            return self._inbound_message(body_chunk.tobytes())
+        # Copy frames straight into their place, a large message isn't
+        # held in pieces for a join. The buffer itself is handed over,
+        # copying it to bytes would need twice the memory again.
+        if self.body is None:
+            self.body = bytearray(self.body_size)
+        self.body[self.body_len:self.body_len + size] = body_chunk
+        self.body_len += size
         if self.body_len == self.body_size:
-            result = self.method_frame
-            props = self.props
+            if self.promise.body_view:
+                return self._inbound_message(memoryview(self.body))
+            return self._inbound_message(self.body)
+
+    def _inbound_message(self, body):
+        result = self.method_frame
+        if self.stream is not None:
+            self.stream.close()
+        else:
+            self._set_headers(result, self.props)
+        result['body'] = body
 
-            result['body'] = compat.join_as_bytes(self.body_chunks)
-            result['headers'] = props.get('headers', {})
-            # Aint need a reference loop.
-            if 'headers' in props:
-                del props['headers']
-            result['headers'].update( props )
+        self._clear_inbound_state()
+        return self._handle_inbound(result)
 
-            self._clear_inbound_state()
-            return self._handle_inbound(result)
+    def _set_headers(self, result, props):
+        result['headers'] = props.get('headers', {})
+        # Aint need a reference loop.
+        if 'headers' in props:
+            del props['headers']
+        result['headers'].update( props )
 
     def _handle_inbound(self, result):
         self.promise.recv_method(result)
+
+
+class BodyStream(object):
+    '''
+    Writes a message body, chunk by chunk, to where the body_sink of
+    a consumer said: an object with a write() method, such as a file,
+    a file descriptor, or a generator, which gets the chunks with
+    send() and is closed at the end. Chunks are memoryviews of the
+    receive buffer, valid only until write() returns.
+    '''
+    def __init__(self, target):
+        self.target = target
+        if isinstance(target, int):
+            self.write = self._write_fd
+        elif isinstance(target, types.GeneratorType):
+            next(target)
+            self.write = target.send
+            self.close = target.close
+        else:
+            self.write = target.write
+
+    def _write_fd(self, chunk):
+        while len(chunk):
+            chunk = chunk[os.write(self.target, chunk):]
+
+    def close(self):
+        pass
@@ -3,6 +3,12 @@ from future.utils import with_metaclass
 
 import functools
 
+try:
+    from concurrent import futures
+except ImportError:
+    # Python 2 without the 'futures' backport.
+    futures = None
+
 from . import connection
 from . import machine
 
@@ -17,12 +23,13 @@ class meta_attach_methods(type):
 def machine_decorator(method):
     @functools.wraps(method)
     def wrapper(*args, **kwargs):
-        callback = kwargs.get('callback')
-        if callback is not None:
-            del kwargs['callback']
+        callback = kwargs.pop('callback', None)
+        timeout = kwargs.pop('timeout', None)
         p = method(*args, **kwargs)
         p.user_callback = callback
         p.after_machine()
+        if timeout is not None:
+            p.set_timeout(timeout)
         return p.number
     return wrapper
 
@@ -59,3 +66,39 @@ class Client(with_metaclass(meta_attach_methods, connection.Connection)):
 
     def basic_reject(self, *args, **kwargs):
         machine.basic_reject(self, *args, **kwargs)
+
+    def publish_threadsafe(self, *args, **kwargs):
+        '''
+        basic_publish() callable from any thread. The message is handed
+        over to the thread running loop(), returns a
+        concurrent.futures.Future of the publish result.
+        '''
+        assert futures is not None, \
+            "publish_threadsafe() needs concurrent.futures"
+        assert 'callback' not in kwargs, \
+            "publish_threadsafe() returns a future, not a callback"
+        future = futures.Future()
+        self.call_soon_threadsafe(self._publish_submitted, future, args,
+                                  kwargs)
+        return future
+
+    def _publish_submitted(self, future, args, kwargs):
+        if not future.set_running_or_notify_cancel():
+            return
+        timeout = kwargs.pop('timeout', None)
+        try:
+            p = machine.basic_publish(self, *args, **kwargs)
+        except Exception as e:
+            future.set_exception(e)
+            return
+        p.user_callback = functools.partial(_resolve_future, future)
+        p.after_machine()
+        if timeout is not None:
+            p.set_timeout(timeout)
+
+
+def _resolve_future(future, promise_number, result):
+    if result.is_error:
+        future.set_exception(result.exception)
+    else:
+        future.set_result(result)
@@ -5,19 +5,38 @@ from future import utils as futils
 
 def as_str(obj):
     """Return a string type, decoding from bytes as needed"""
+    if isinstance(obj, memoryview):
+        obj = obj.tobytes()
     if not futils.PY2 and hasattr(obj, 'decode'):
         obj = obj.decode('utf-8')
     return obj
 
 
 def as_bytes(obj):
-    """Return a bytes type, encoding from string as needed"""
-    if not isinstance(obj, futils.binary_type):
-        obj = obj.encode('utf-8')
-    return obj
+    """Return a bytes type, encoding from string as needed. Objects
+    supporting the buffer protocol (bytearray, memoryview, array,
+    numpy arrays...) are returned as a flat buffer of bytes, without
+    copying unless they aren't contiguous."""
+    if isinstance(obj, (futils.binary_type, bytearray)):
+        return obj
+    if isinstance(obj, futils.text_type):
+        return obj.encode('utf-8')
+    view = memoryview(obj)
+    if view.ndim != 1 or view.itemsize != 1:
+        if futils.PY2 or not view.c_contiguous:
+            return view.tobytes()
+        view = view.cast('B')
+    return view
 
 
 def join_as_bytes(args):
     """Join string args to a byte string, encoding to bytes as needed"""
     args = (as_bytes(o) for o in args)
-    return b''.join(args)
\ No newline at end of file
+    return b''.join(args)
+
+
+try:
+    # Python 3.3+
+    from time import monotonic
+except ImportError:
+    from time import time as monotonic
@@ -0,0 +1,200 @@
+'''
+Non-blocking TCP connect. Addresses are resolved once and cached, then
+connection attempts are raced the way RFC 8305 ("Happy Eyeballs")
+suggests: a new attempt starts every 'attempt_delay' seconds, or
+straight away when the previous one fails, and the first socket to
+connect wins.
+'''
+from __future__ import absolute_import
+from builtins import range
+
+import errno
+import os
+import socket
+
+from .compat import monotonic
+
+
+# getaddrinfo() doesn't tell the record TTL, keep results for a while
+# so reconnecting many clients at once doesn't hammer the resolver.
+DNS_TTL = 60.0
+
+_dns_cache = {}
+
+
+def resolve(host, port, ttl=None):
+    '''
+    Resolve the address with getaddrinfo(), results are cached for
+    'ttl' seconds (DNS_TTL by default).
+    '''
+    key = (host, port)
+    now = monotonic()
+    entry = _dns_cache.get(key)
+    if entry is not None and entry[0] > now:
+        return entry[1]
+    addrinfo = socket.getaddrinfo(host, port, socket.AF_UNSPEC,
+                                  socket.SOCK_STREAM)
+    if not socket.has_ipv6:
+        addrinfo = [ai for ai in addrinfo if ai[0] != socket.AF_INET6]
+    addrinfo = interleave(addrinfo)
+    _dns_cache[key] = (now + (DNS_TTL if ttl is None else ttl), addrinfo)
+    return addrinfo
+
+
+def forget(host, port):
+    '''
+    Drop the cached address, for example when none of them worked.
+    '''
+    _dns_cache.pop((host, port), None)
+
+
+def interleave(addrinfo):
+    '''
+    Reorder addresses so that address families alternate, keeping the
+    family of the first (preferred) address in front.
+
+    >>> interleave([(10, 'a'), (10, 'b'), (2, 'c'), (2, 'd'), (2, 'e')])
+    [(10, 'a'), (2, 'c'), (10, 'b'), (2, 'd'), (2, 'e')]
+    >>> interleave([(2, 'a'), (10, 'b')])
+    [(2, 'a'), (10, 'b')]
+    '''
+    families = []
+    by_family = {}
+    for ai in addrinfo:
+        if ai[0] not in by_family:
+            families.append(ai[0])
+            by_family[ai[0]] = []
+        by_family[ai[0]].append(ai)
+    groups = [by_family[family] for family in families]
+    ordered = []
+    for i in range(max([len(group) for group in groups] or [0])):
+        for group in groups:
+            if i < len(group):
+                ordered.append(group[i])
+    return ordered
+
+
+class Connector(object):
+    '''
+    Races connection attempts to 'addresses'. Attempts are registered in
+    the selector as separate handlers, once one of them connects the
+    others are closed and conn._connected() gets the socket. When all of
+    them fail the connection is shut down.
+    '''
+    # RFC 8305 recommends 250ms.
+    attempt_delay = 0.25
+
+    def __init__(self, conn, addresses):
+        self.conn = conn
+        self.addresses = list(addresses)
+        self.attempts = []
+        self.selector = None
+        self.error = None
+        self._timer = None
+
+    def start(self):
+        '''
+        Start the first attempt. Raises if none of the addresses could
+        be tried at all.
+        '''
+        self._start_next()
+        if not self.attempts:
+            raise self.error
+
+    def _start_next(self):
+        self._cancel_timer()
+        while self.addresses:
+            family, socktype, proto, _, sockaddr = self.addresses.pop(0)
+            try:
+                sd = self.conn._new_socket(family, socktype, proto)
+            except socket.error as e:
+                self.error = e
+                continue
+            try:
+                sd.connect(sockaddr)
+            except socket.error as e:
+                if e.errno not in (errno.EINPROGRESS, errno.EWOULDBLOCK):
+                    sd.close()
+                    self.error = e
+                    continue
+            self.attempts.append(_Attempt(self, sd))
+            if self.addresses:
+                self._timer = self.conn.timers.call_later(self.attempt_delay,
+                                                          self._start_next)
+            return
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def fileno(self):
+        # For user event loops, that can only watch a single descriptor.
+        return self.attempts[0].sd.fileno()
+
+    def io_sync(self, selector):
+        self.selector = selector
+        for attempt in self.attempts:
+            if not attempt.registered:
+                selector.register(attempt.sd.fileno(), attempt, True)
+                attempt.registered = True
+
+    def unregister(self):
+        for attempt in self.attempts:
+            attempt.unregister()
+
+    def close(self):
+        self._cancel_timer()
+        for attempt in self.attempts:
+            attempt.close()
+        self.attempts = []
+
+    def _succeeded(self, winner):
+        self._cancel_timer()
+        for attempt in self.attempts:
+            attempt.unregister()
+            if attempt is not winner:
+                attempt.close()
+        self.attempts = []
+        self.conn._connected(winner.sd)
+
+    def _failed(self, attempt, error):
+        attempt.close()
+        self.attempts.remove(attempt)
+        self.error = error
+        if self.addresses:
+            self._start_next()
+        if not self.attempts:
+            self._cancel_timer()
+            self.conn._connect_failed(error)
+
+
+class _Attempt(object):
+    def __init__(self, connector, sd):
+        self.connector = connector
+        self.sd = sd
+        self.registered = False
+        self.finished = False
+
+    def on_read(self):
+        # Errors may be reported as readability.
+        self.on_write()
+
+    def on_write(self):
+        if self.finished:
+            return
+        self.finished = True
+        err = self.sd.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if err:
+            self.connector._failed(self, socket.error(err, os.strerror(err)))
+        else:
+            self.connector._succeeded(self)
+
+    def unregister(self):
+        if self.registered:
+            self.connector.selector.unregister(self.sd.fileno())
+            self.registered = False
+
+    def close(self):
+        self.unregister()
+        self.sd.close()
@@ -5,6 +5,8 @@ from . import spec_exceptions
 
 class ConnectionBroken(socket.error): pass
 class UnsupportedProtocol(socket.error): pass
+class PromiseTimeout(socket.timeout): pass
+class WouldBlock(socket.error): pass
 
 
 def exception_from_frame(result):
@@ -1,26 +1,39 @@
 from __future__ import absolute_import
 import future.utils as futils
 
+import collections
 import copy
+import itertools
 import logging
 from collections import OrderedDict
 
 from . import exceptions
 from . import spec
+from . import stream
 
 log = logging.getLogger('puka')
 
 def _nothing(t):
     pass
 
+def connection_broken(t):
+    t.done(exceptions.mark_frame(spec.Frame(),
+                                 exceptions.ConnectionBroken()))
+
 ####
 def connection_handshake(conn):
     # Bypass conn._send, we want the socket to be writable first.
     conn.send_buf.write(spec.PREAMBLE)
-    t = conn.promises.new(_connection_handshake, reentrant=True)
+    t = conn.promises.new(_connection_handshake, reentrant=True,
+                          needs_connection=False)
+    t.on_timeout = _connection_timeout
     conn.x_connection_promise = t
     return t
 
+def _connection_timeout(t, result):
+    # Connection is unusable, fail all the promises.
+    t.conn._shutdown(result)
+
 def _connection_handshake(t):
     assert t.channel.number == 0
     t.register(spec.METHOD_CONNECTION_START, _connection_start)
@@ -33,6 +46,8 @@ def _connection_start(t, result):
     ccapa = {}
     if scapa.get('consumer_cancel_notify'):
         ccapa['consumer_cancel_notify'] = True
+    if scapa.get('connection.blocked'):
+        ccapa['connection.blocked'] = True
 
     properties = {'product': 'Puka', 'capabilities': ccapa}
     if t.conn.client_properties is not None:
@@ -58,17 +73,45 @@ def _connection_tune(t, result):
     frame_max = t.conn._tune_frame_max(result['frame_max'])
     channel_max = t.conn.channels.tune_channel_max(result['channel_max'])
 
+    heartbeat = t.conn._tune_heartbeat(result['heartbeat'])
+
     t.register(spec.METHOD_CONNECTION_OPEN_OK, _connection_open_ok)
-    f1 = spec.encode_connection_tune_ok(channel_max, frame_max, t.conn.heartbeat)
+    f1 = spec.encode_connection_tune_ok(channel_max, frame_max, heartbeat)
     f2 = spec.encode_connection_open(t.conn.vhost)
     t.send_frames(f1 + f2)
+    t.conn._heartbeat_start()
 
 def _connection_open_ok(ct, result):
     ct.register(spec.METHOD_CONNECTION_CLOSE, _connection_close)
+    ct.register(spec.METHOD_CONNECTION_BLOCKED, _connection_blocked)
+    ct.register(spec.METHOD_CONNECTION_UNBLOCKED, _connection_unblocked)
     # Never free the promise and channel.
     ct.ping(ct.x_cached_result)
     ct.conn.x_connection_promise = ct
+    recovering = ct.conn._was_connected
+    ct.conn._on_connected()
     publish_promise(ct.conn)
+    if recovering and ct.conn.reconnect:
+        recover(ct.conn)
+
+def _connection_blocked(ct, result):
+    ct.register(spec.METHOD_CONNECTION_BLOCKED, _connection_blocked)
+    conn = ct.conn
+    conn.blocked = result['reason']
+    log.warning('Publishing blocked by the broker: %s', conn.blocked)
+    if conn.on_blocked is not None:
+        conn.on_blocked(conn.blocked)
+
+def _connection_unblocked(ct, result):
+    ct.register(spec.METHOD_CONNECTION_UNBLOCKED, _connection_unblocked)
+    conn = ct.conn
+    conn.blocked = None
+    log.info('Publishing unblocked by the broker')
+    if conn.on_unblocked is not None:
+        conn.on_unblocked()
+    # Send what was held meanwhile.
+    _pt_async_flush(conn.x_publish_promise)
+    conn._maybe_flush()
 
 
 def publish_promise(conn):
@@ -102,7 +145,21 @@ def fix_basic_publish_headers(headers):
     return nheaders
 
 def basic_publish(conn, exchange, routing_key='', mandatory=False,
-                  headers={}, body=''):
+                  headers={}, body='', body_size=None):
+    if not conn._opened:
+        # The publish channel went away with the socket, the new one
+        # isn't there yet.
+        return conn.promises.new(connection_broken, no_channel=True)
+    if not conn.writable or conn.blocked is not None:
+        if conn.publish_backpressure == 'error':
+            return conn.promises.new(_basic_publish_would_block,
+                                     no_channel=True)
+        elif conn.publish_backpressure == 'block':
+            conn._wait_unblocked()
+            conn._wait_writable()
+    if stream.is_stream(body):
+        return _basic_publish_stream(conn, exchange, routing_key, mandatory,
+                                     headers, body, body_size)
     pt = conn.x_publish_promise
     delivery_tag = pt.x_delivery_tag
     pt.x_delivery_tag += 1
@@ -121,12 +178,88 @@ def basic_publish(conn, exchange, routing_key='', mandatory=False,
                  spec.encode_basic_publish('', '', True, False, eheaders,
                                                 '', conn.frame_max)
     t = conn.promises.new(_nothing, no_channel=True)
+    t.x_delivery_tag = delivery_tag
+    t.on_timeout = _basic_publish_timeout
     pt.x_async_next.append( (delivery_tag, t, frames) )
     _pt_async_flush(pt)
     return t
 
+def _basic_publish_stream(conn, exchange, routing_key, mandatory, headers,
+                          body, body_size):
+    # A body that's streamed would hold up all the other publishes, it
+    # gets its own channel.
+    t = conn.promises.new(_bps_channel)
+    props, nheaders = spec.split_headers(fix_basic_publish_headers(headers),
+                                         spec.BASIC_PROPS_SET)
+    if nheaders:
+        props['headers'] = nheaders
+    body_size = stream.body_size(body, body_size)
+    t.x_frames = [spec.encode_basic_publish(exchange, routing_key, mandatory,
+                                            False, {}, '', conn.frame_max)[0],
+                  spec.encode_basic_properties(body_size, props)]
+    t.x_body = stream.body_frames(body, body_size, conn.frame_max)
+    t.x_stream = t.x_returned = None
+    t.on_timeout = _bps_timeout
+    return t
+
+def _bps_channel(t):
+    if t.conn.x_pubacks and not t.channel.confirm:
+        t.register(spec.METHOD_CONFIRM_SELECT_OK, _bps_confirm_select_ok)
+        t.send_request(spec.encode_confirm_select())
+    else:
+        _bps_send(t)
+
+def _bps_confirm_select_ok(t, result):
+    t.channel.confirm = True
+    _bps_send(t)
+
+def _bps_send(t):
+    frames = t.x_body
+    if t.conn.x_pubacks:
+        t.register(spec.METHOD_BASIC_ACK, _bps_basic_ack)
+    else:
+        # When the broker returns the footer, the message went through.
+        frames = itertools.chain(frames, spec.encode_basic_publish(
+                '', '', True, False, {'x-puka-footer': True}, '',
+                t.conn.frame_max))
+    t.register(spec.METHOD_BASIC_RETURN, _bps_basic_return)
+    # The method and header frames go out with the body, none of it
+    # is sent while the broker blocks us.
+    t.x_stream = t.conn._send_stream(t, itertools.chain(t.x_frames, frames))
+
+def _bps_basic_return(t, result):
+    if 'x-puka-footer' in result['headers']:
+        t.done(t.x_returned or spec.Frame())
+    else:
+        # The confirmation follows.
+        t.register(spec.METHOD_BASIC_RETURN, _bps_basic_return)
+        t.x_returned = exceptions.mark_frame(result)
+
+def _bps_basic_ack(t, result):
+    t.done(t.x_returned or spec.Frame())
+
+def _bps_timeout(t, result):
+    if t.x_stream is not None and t.x_stream.active and t.x_stream.started:
+        # The body can't be cut short, the channel is closed once it's
+        # all sent.
+        from .promise import ChannelReaper
+        channel, t.channel = t.channel, None
+        t.x_stream.finish = True
+        t.x_stream.on_done = lambda: ChannelReaper(t.conn, channel)
+
+def _basic_publish_would_block(t):
+    t.done(exceptions.mark_frame(spec.Frame(), exceptions.WouldBlock()))
+
+def _basic_publish_timeout(t, result):
+    # Don't send the message if it's still queued. If it was sent, the
+    # confirmation will be ignored.
+    pt = t.conn.x_publish_promise
+    pt.x_async_inflight.pop(t.x_delivery_tag, None)
+    pt.x_async_next = [item for item in pt.x_async_next if item[1] is not t]
+
 def _pt_async_flush(pt):
-    if pt.x_async_enabled:
+    # While the broker blocks us messages wait here, not in the socket.
+    if pt.x_async_enabled and pt.conn.blocked is None:
         frames_acc = []
         for delivery_tag, t, frames in pt.x_async_next:
             pt.x_async_inflight[delivery_tag] = t
@@ -189,11 +322,21 @@ def _connection_close(t, result):
     t.conn._shutdown(result)
 
 def connection_close(conn):
+    if not conn._io_active():
+        # Not connected, for example waiting to reconnect. Fail the
+        # consumers kept for recovery.
+        conn._shutdown(exceptions.mark_frame(spec.Frame(),
+                                             exceptions.ConnectionBroken()))
+        return conn.promises.new(_connection_closed, no_channel=True,
+                                 needs_connection=False)
     t = conn.x_connection_promise
     t.register(spec.METHOD_CONNECTION_CLOSE_OK, _connection_close_ok)
     t.send_frames(spec.encode_connection_close(200, '', 0, 0))
     return t
 
+def _connection_closed(t):
+    t.done(spec.Frame())
+
 def _connection_close_ok(t, result):
     # Ping this promise with success.
     t.ping(copy.copy(result))
@@ -206,7 +349,7 @@ def _connection_close_ok(t, result):
 def channel_open(t, callback):
     t.register(spec.METHOD_CHANNEL_OPEN_OK, _channel_open_ok)
     t.x_callback = callback
-    t.send_frames( spec.encode_channel_open('') )
+    t.send_request( spec.encode_channel_open('') )
 
 def _channel_open_ok(t, result):
     t.x_callback()
@@ -218,31 +361,40 @@ def queue_declare(conn, queue='', durable=False, exclusive=False,
     t = conn.promises.new(_queue_declare)
     t.x_frames = spec.encode_queue_declare(queue, passive, durable, exclusive,
                                            auto_delete, arguments)
+    if not passive:
+        t.x_record = ('queue_declare', (not queue, durable, exclusive,
+                                        auto_delete, arguments))
     return t
 
 def _queue_declare(t, result=None):
     t.register(spec.METHOD_QUEUE_DECLARE_OK, _queue_declare_ok)
-    t.send_frames(t.x_frames)
+    t.send_request(t.x_frames)
 
 def _queue_declare_ok(t, result):
+    _record(t, result['queue'])
     t.done(result)
 
 
 ####
 def basic_consume(conn, queue, prefetch_count=0, no_local=False, no_ack=False,
-                  exclusive=False, arguments={}):
+                  exclusive=False, arguments={}, body_sink=None,
+                  body_view=False):
     q = {'queue': queue,
          'no_local': no_local,
          'exclusive': exclusive,
          'arguments': arguments,
          }
-    return basic_consume_multi(conn, [q], prefetch_count, no_ack)
+    return basic_consume_multi(conn, [q], prefetch_count, no_ack, body_sink,
+                               body_view)
 
 ####
-def basic_consume_multi(conn, queues, prefetch_count=0, no_ack=False):
+def basic_consume_multi(conn, queues, prefetch_count=0, no_ack=False,
+                        body_sink=None, body_view=False):
     t = conn.promises.new(_bcm_basic_qos, reentrant=True)
+    t.body_sink = body_sink
+    t.body_view = body_view
     t.x_frames = spec.encode_basic_qos(0, prefetch_count, False)
-    t.x_consumes = []
+    t.x_consume_args = []
     for i, item in enumerate(queues):
         if isinstance(item, str):
             queue = item
@@ -255,17 +407,30 @@ def basic_consume_multi(conn, queues, prefetch_count=0, no_ack=False):
             exclusive = item.get('exclusive', False)
             arguments = item.get('arguments', {})
             consumer_tag = '%s.%s.%s' % (t.number, i, item.get('consumer_tag', ''))
-        t.x_consumes.append( (queue, spec.encode_basic_consume(
-                    queue, consumer_tag, no_local, no_ack, exclusive, arguments)) )
+        t.x_consume_args.append( [queue, consumer_tag, no_local, exclusive,
+                                  arguments] )
     t.x_no_ack = no_ack
+    # Delivery tags start from 1 on every channel. After a recovery
+    # they're shifted, so that acks for messages from the old channel
+    # can be told apart.
+    t.x_delivery_tag_shift = t.x_delivery_tag_max = 0
+    t.recoverable = conn.reconnect
+    _bcm_prepare(t)
+    return t
+
+def _bcm_prepare(t):
+    t.x_consumes = []
+    for queue, consumer_tag, no_local, exclusive, arguments in t.x_consume_args:
+        t.x_consumes.append( (queue, spec.encode_basic_consume(
+                    queue, consumer_tag, no_local, t.x_no_ack, exclusive,
+                    arguments)) )
     t.x_consumer_tag = {}
     t.register(spec.METHOD_BASIC_DELIVER, _bcm_basic_deliver)
     t.register(spec.METHOD_BASIC_CANCEL, _bcm_basic_cancel)
-    return t
 
 def _bcm_basic_qos(t):
     t.register(spec.METHOD_BASIC_QOS_OK, _bcm_basic_qos_ok)
-    t.send_frames(t.x_frames)
+    t.send_request(t.x_frames)
 
 def _bcm_basic_qos_ok(t, result):
     _bcm_send_basic_consume(t)
@@ -273,16 +438,21 @@ def _bcm_basic_qos_ok(t, result):
 def _bcm_send_basic_consume(t):
     t.register(spec.METHOD_BASIC_CONSUME_OK, _bcm_basic_consume_ok)
     t.x_queue, frames = t.x_consumes.pop()
-    t.send_frames(frames)
+    t.send_request(frames)
 
 def _bcm_basic_consume_ok(t, consume_result):
     t.x_consumer_tag[t.x_queue] = consume_result['consumer_tag']
     if t.x_consumes:
         _bcm_send_basic_consume(t)
+    else:
+        # The consumer is running, a timeout doesn't tear it down.
+        t.cancel_timeout()
 
 def _bcm_basic_deliver(t, msg_result):
     t.register(spec.METHOD_BASIC_DELIVER, _bcm_basic_deliver)
     msg_result['promise_number'] = t.number
+    msg_result['delivery_tag'] += t.x_delivery_tag_shift
+    t.x_delivery_tag_max = msg_result['delivery_tag']
     if t.x_no_ack is False:
         t.refcnt_inc()
     t.ping(msg_result)
@@ -292,10 +462,22 @@ def _bcm_basic_cancel(ct, result):
     ct.x_ct = ct
     _basic_cancel(ct)
 
+def _delivery_tag(t, msg_result):
+    # None if the message came from a channel that's gone, the broker
+    # requeued it already.
+    delivery_tag = msg_result['delivery_tag'] - \
+        getattr(t, 'x_delivery_tag_shift', 0)
+    if t.conn.sd is None or t.channel is None or delivery_tag <= 0 or \
+            t.conn.channels.channels.get(t.channel.number) is not t.channel:
+        return None
+    return delivery_tag
+
 ##
 def basic_ack(conn, msg_result):
     t = conn.promises.by_number(msg_result['promise_number'])
-    t.send_frames( spec.encode_basic_ack(msg_result['delivery_tag'], False) )
+    delivery_tag = _delivery_tag(t, msg_result)
+    if delivery_tag is not None:
+        t.send_frames( spec.encode_basic_ack(delivery_tag, False) )
     assert t.x_no_ack is False
     t.refcnt_dec()
     return t
@@ -303,7 +485,9 @@ def basic_ack(conn, msg_result):
 ##
 def basic_reject(conn, msg_result, requeue=True):
     t = conn.promises.by_number(msg_result['promise_number'])
-    t.send_frames(spec.encode_basic_reject(msg_result['delivery_tag'], requeue))
+    delivery_tag = _delivery_tag(t, msg_result)
+    if delivery_tag is not None:
+        t.send_frames(spec.encode_basic_reject(delivery_tag, requeue))
     assert t.x_no_ack is False
     t.refcnt_dec()
     return t
@@ -314,12 +498,16 @@ def basic_qos(conn, consume_promise, prefetch_count=0):
     t = conn.promises.new(_basic_qos, no_channel=True)
     t.x_ct = conn.promises.by_number(consume_promise)
     t.x_frames = spec.encode_basic_qos(0, prefetch_count, False)
+    t.on_timeout = _basic_qos_timeout
     return t
 
+def _basic_qos_timeout(t, result):
+    t.x_ct.register(spec.METHOD_BASIC_QOS_OK, _generic_callback_nop)
+
 def _basic_qos(t):
     ct = t.x_ct
     ct.register(spec.METHOD_BASIC_QOS_OK, _basic_qos_ok)
-    ct.send_frames( t.x_frames )
+    ct.send_request( t.x_frames )
     ct.x_qos_promise = t
 
 def _basic_qos_ok(ct, result):
@@ -331,8 +519,15 @@ def basic_cancel(conn, consume_promise):
     # TODO: race?
     t = conn.promises.new(_basic_cancel, no_channel=True)
     t.x_ct = conn.promises.by_number(consume_promise)
+    t.on_timeout = _basic_cancel_timeout
     return t
 
+def _basic_cancel_timeout(t, result):
+    # Finish the cancel as if it was requested by the broker, the
+    # consume promise gets the result.
+    if t.x_ct.x_mt is t:
+        t.x_ct.x_mt = t.x_ct
+
 def _basic_cancel(t):
     t.x_ct.x_mt = t
     _basic_cancel_one(t.x_ct)
@@ -340,7 +535,7 @@ def _basic_cancel(t):
 def _basic_cancel_one(ct):
     consumer_tag = ct.x_consumer_tag.pop(list(ct.x_consumer_tag.keys())[0])
     ct.register(spec.METHOD_BASIC_CANCEL_OK, _basic_cancel_ok)
-    ct.send_frames( spec.encode_basic_cancel(consumer_tag) )
+    ct.send_request( spec.encode_basic_cancel(consumer_tag) )
 
 def _basic_cancel_ok(ct, result):
     if ct.x_consumer_tag:
@@ -353,8 +548,10 @@ def _basic_cancel_ok(ct, result):
         ct.refcnt_clear()
 
 ####
-def basic_get(conn, queue, no_ack=False):
+def basic_get(conn, queue, no_ack=False, body_sink=None, body_view=False):
     t = conn.promises.new(_basic_get)
+    t.body_sink = body_sink
+    t.body_view = body_view
     t.x_frames = spec.encode_basic_get(queue, no_ack)
     t.x_no_ack = no_ack
     return t
@@ -362,7 +559,7 @@ def basic_get(conn, queue, no_ack=False):
 def _basic_get(t):
     t.register(spec.METHOD_BASIC_GET_OK, _basic_get_ok)
     t.register(spec.METHOD_BASIC_GET_EMPTY, _basic_get_empty)
-    t.send_frames(t.x_frames)
+    t.send_request(t.x_frames)
 
 def _basic_get_ok(t, msg_result):
     msg_result['promise_number'] = t.number
@@ -382,32 +579,44 @@ def exchange_declare(conn, exchange, type='direct', durable=False,
 
     t.x_frames = spec.encode_exchange_declare(exchange, type, False, durable,
                                               auto_delete, False, arguments)
+    t.x_record = ('exchange_declare', (exchange, type, durable, auto_delete,
+                                       arguments))
     return t
 
 def _exchange_declare(t, result=None):
     t.register(spec.METHOD_EXCHANGE_DECLARE_OK, _exchange_declare_ok)
-    t.send_frames(t.x_frames)
+    t.send_request(t.x_frames)
 
 def _exchange_declare_ok(t, result):
+    _record(t)
     t.done(result)
 
 
 ####
 def _generic_callback(t):
     t.register(t.x_method, _generic_callback_ok)
-    t.send_frames(t.x_frames)
+    t.send_request(t.x_frames)
 
 def _generic_callback_ok(t, result):
+    _record(t)
     t.done(result)
 
 def _generic_callback_nop(t, result):
     pass
 
+def _record(t, *args):
+    # Remember the topology, to declare it again after a reconnect.
+    record = getattr(t, 'x_record', None)
+    if record is not None and t.conn.reconnect:
+        name, record_args = record
+        getattr(t.conn.topology, name)(*(args + record_args))
+
 ####
 def exchange_delete(conn, exchange, if_unused=False):
     t = conn.promises.new(_generic_callback)
     t.x_method = spec.METHOD_EXCHANGE_DELETE_OK
     t.x_frames = spec.encode_exchange_delete(exchange, if_unused)
+    t.x_record = ('exchange_delete', (exchange,))
     return t
 
 def exchange_bind(conn, destination, source, routing_key='', arguments={}):
@@ -415,6 +624,8 @@ def exchange_bind(conn, destination, source, routing_key='', arguments={}):
     t.x_method = spec.METHOD_EXCHANGE_BIND_OK
     t.x_frames = spec.encode_exchange_bind(destination, source, routing_key,
                                            arguments)
+    t.x_record = ('exchange_bind', (destination, source, routing_key,
+                                    arguments))
     return t
 
 def exchange_unbind(conn, destination, source, routing_key='', arguments={}):
@@ -422,12 +633,15 @@ def exchange_unbind(conn, destination, source, routing_key='', arguments={}):
     t.x_method = spec.METHOD_EXCHANGE_UNBIND_OK
     t.x_frames = spec.encode_exchange_unbind(destination, source, routing_key,
                                              arguments)
+    t.x_record = ('exchange_unbind', (destination, source, routing_key,
+                                      arguments))
     return t
 
 def queue_delete(conn, queue, if_unused=False, if_empty=False):
     t = conn.promises.new(_generic_callback)
     t.x_method = spec.METHOD_QUEUE_DELETE_OK
     t.x_frames = spec.encode_queue_delete(queue, if_unused, if_empty)
+    t.x_record = ('queue_delete', (queue,))
     return t
 
 def queue_purge(conn, queue):
@@ -441,6 +655,7 @@ def queue_bind(conn, queue, exchange, routing_key='', arguments={}):
     t.x_method = spec.METHOD_QUEUE_BIND_OK
     t.x_frames = spec.encode_queue_bind(queue, exchange, routing_key,
                                         arguments)
+    t.x_record = ('queue_bind', (queue, exchange, routing_key, arguments))
     return t
 
 def queue_unbind(conn, queue, exchange, routing_key='', arguments={}):
@@ -448,5 +663,63 @@ def queue_unbind(conn, queue, exchange, routing_key='', arguments={}):
     t.x_method = spec.METHOD_QUEUE_UNBIND_OK
     t.x_frames = spec.encode_queue_unbind(queue, exchange, routing_key,
                                           arguments)
+    t.x_record = ('queue_unbind', (queue, exchange, routing_key, arguments))
     return t
 
+
+
+####
+def recover(conn):
+    '''
+    Declare the recorded topology again on a fresh connection, then
+    restart the consumers. Declarations are sent in a single burst.
+    '''
+    conn.topology.on_rename = lambda old, new: _recover_rename(conn, old, new)
+    t = conn.promises.new(_recover)
+    t.x_steps = collections.deque(conn.topology.replay())
+    t.after_machine()
+
+def _recover(t):
+    t.register(spec.METHOD_CHANNEL_CLOSE, _recover_channel_close)
+    if t.x_steps:
+        frames = []
+        for step_frames, _, _ in t.x_steps:
+            frames.extend(step_frames)
+        t.send_request(frames)
+    _recover_next(t)
+
+def _recover_next(t):
+    if t.x_steps:
+        t.register(t.x_steps[0][1], _recover_reply)
+    else:
+        _recover_consumers(t.conn)
+        t.done(spec.Frame())
+
+def _recover_reply(t, result):
+    _, _, callback = t.x_steps.popleft()
+    if callback is not None:
+        callback(result)
+    _recover_next(t)
+
+def _recover_channel_close(t, result):
+    log.error('Failed to recover topology: %r', result)
+    t.send_frames(spec.encode_channel_close_ok())
+    t.channel.alive = False
+    exceptions.mark_frame(result)
+    _recover_consumers(t.conn)
+    t.done(result)
+
+def _recover_rename(conn, old, new):
+    for ct in conn.promises.all():
+        for args in getattr(ct, 'x_consume_args', ()):
+            if args[0] == old:
+                args[0] = new
+
+def _recover_consumers(conn):
+    for ct in conn.promises.all():
+        if ct.recoverable and not ct.to_be_released:
+            ct.x_delivery_tag_shift = ct.x_delivery_tag_max
+            ct.methods.clear()
+            _bcm_prepare(ct)
+            conn.channels.allocate(ct, ct._on_channel)
+            ct.after_machine()
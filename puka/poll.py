@@ -1,17 +1,119 @@
 from __future__ import absolute_import
 
-import select
+import collections
+
+from . import selector as selector_module
+from . import timer
+from .compat import monotonic
+
+
+class Hub(object):
+    '''
+    Event loop shared by many clients.
+
+    All attached clients are registered in a single selector, the hub
+    also runs a timer queue and a queue of callbacks ready to be run.
+    Timers of the attached clients are honoured too.
+
+    clients     - an iterable of clients to attach straight away
+    selector    - selector engine, see puka.selector
+    read_budget - maximum number of bytes a client may read from its
+                  socket in a single loop iteration. This stops one busy
+                  connection from starving the others.
+    '''
+    def __init__(self, clients=(), selector=None, read_budget=256*1024):
+        if selector is None:
+            selector = selector_module.default_selector()
+        self.selector = selector
+        self.timers = timer.TimerQueue()
+        self.read_budget = read_budget
+        self.clients = []
+        self._ready = collections.deque()
+        self._loop_break = False
+        for client in clients:
+            self.add(client)
+
+    def add(self, client):
+        '''
+        Attach a client. From now on it's driven by the hub loop.
+        '''
+        # Move the socket, and the waker, from the client's own
+        # selector. Even if the client is waiting to reconnect.
+        client._io_unregister()
+        client.selector = self.selector
+        client.read_budget = self.read_budget
+        self.clients.append(client)
+
+    def remove(self, client):
+        '''
+        Detach a client, it may be used standalone afterwards.
+        '''
+        self.clients.remove(client)
+        client._io_unregister()
+        client.selector = None
+        del client.read_budget
+
+    def call_soon(self, callback, *args):
+        self._ready.append((callback, args))
+
+    def call_later(self, delay, callback, *args):
+        return self.timers.call_later(delay, callback, *args)
+
+    def run_any_callbacks(self):
+        '''
+        Run ready callbacks, expired timers and callbacks of all the
+        attached clients, but do not block.
+        '''
+        # Callbacks scheduled from now on will wait for the next round.
+        for _ in range(len(self._ready)):
+            callback, args = self._ready.popleft()
+            callback(*args)
+        self.timers.run()
+        for client in list(self.clients):
+            client.run_any_callbacks()
+
+    def loop(self, timeout=None):
+        '''
+        Run the event loop until loop_break() is called, or the timeout
+        expires.
+        '''
+        if timeout is not None:
+            t1 = monotonic() + timeout
+        self._loop_break = False
+
+        while True:
+            self.run_any_callbacks()
+
+            if self._loop_break:
+                break
+
+            td = 0 if self._ready else self.timers.timeout()
+            if timeout is not None:
+                left = t1 - monotonic()
+                if left < 0:
+                    break
+                td = left if td is None else min(td, left)
+            self._poll(td)
+
+        # Flush write buffers, as Client.loop() does.
+        for client in list(self.clients):
+            if client.sd is not None:
+                client._try_flush()
+
+    def loop_break(self):
+        self._loop_break = True
+
+    def _poll(self, timeout):
+        for client in self.clients:
+            client._io_sync()
+            # Client timers are run by client.run_any_callbacks().
+            timeout = client._next_timeout(timeout)
+        for handler, readable, writable in self.selector.poll(timeout):
+            if readable:
+                handler.on_read()
+            if writable:
+                handler.on_write()
+
 
 def loop(clients):
-    while True:
-        for c in clients:
-            c.run_any_callbacks()
-
-        rfds = clients
-        wfds = [c for c in clients if c.needs_write()]
-        r, w, e = select.select(rfds, wfds, rfds)
-
-        for c in r:
-            c.on_read()
-        for c in w:
-            c.on_write()
+    Hub(clients).loop()
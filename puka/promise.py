@@ -2,6 +2,8 @@ from __future__ import absolute_import, print_function
 import logging
 
 from . import channel
+from . import compat
+from . import machine
 from . import spec
 from . import exceptions
 
@@ -15,7 +17,12 @@ class PromiseCollection(object):
         self.promise_number = 1
         self.ready = set()
 
-    def new(self, on_channel, **kwargs):
+    def new(self, on_channel, needs_connection=True, **kwargs):
+        if needs_connection and not self.conn._opened:
+            # Not connected, for example waiting to reconnect. Nothing
+            # can be sent, the promise just fails.
+            on_channel = machine.connection_broken
+            kwargs['no_channel'] = True
         number = self.promise_number
         self.promise_number += 1
         promise = Promise(self.conn, number, on_channel, **kwargs)
@@ -47,6 +54,18 @@ class Promise(object):
     user_callback = None
     after_machine_callback = None
     refcnt = 0
+    timeout_timer = None
+    request_sent_at = None
+    # Survives a reconnect, see machine.recover().
+    recoverable = False
+    # Called with (promise, result) when the promise times out, before
+    # the promise is failed.
+    on_timeout = None
+    # Called with a message without its body, returns where the body
+    # is streamed to, see channel.BodyStream.
+    body_sink = None
+    # Deliver bodies as memoryviews, see channel.inbound_body().
+    body_view = False
 
     def __init__(self, conn, number, on_channel, reentrant=False,
                  no_channel=False):
@@ -83,6 +102,10 @@ class Promise(object):
 
     def recv_method(self, result):
         # log.debug('#%i recv_method %r', self.number, result)
+        if self.request_sent_at is not None and \
+                result.method_id != spec.METHOD_BASIC_DELIVER:
+            self.conn._rtt_sample(compat.monotonic() - self.request_sent_at)
+            self.request_sent_at = None
         # In this order, to allow callback to re-register to the same method.
         callback = self.methods[result.method_id]
         del self.methods[result.method_id]
@@ -97,6 +120,14 @@ class Promise(object):
     def send_frames(self, frames):
         self.conn._send_frames(self.channel.number, frames)
 
+    def send_request(self, frames):
+        '''
+        Send frames the broker is going to reply to, the time it takes
+        goes into the round trip time estimate.
+        '''
+        self.request_sent_at = compat.monotonic()
+        self.send_frames(frames)
+
     def done(self, result, delay_release=None, no_callback=False):
         # log.debug('#%i done %r', self.number, result)
         assert self.to_be_released == False
@@ -107,6 +138,7 @@ class Promise(object):
         else:
             self.callbacks.append( (None, result) )
         self.conn.promises.mark_ready(self)
+        self.cancel_timeout()
         self.to_be_released = True
         self.delay_release = delay_release
         self.methods.clear()
@@ -117,6 +149,7 @@ class Promise(object):
         assert self.reentrant
         self.callbacks.append( (self.user_callback, result) )
         self.conn.promises.mark_ready(self)
+        self.cancel_timeout()
 
     def run_callback(self, raise_errors=True):
         user_callback, result = self.callbacks.pop(0)
@@ -137,6 +170,36 @@ class Promise(object):
             self.after_machine_callback()
             self.after_machine_callback = None
 
+    def set_timeout(self, timeout):
+        '''
+        Fail the promise with PromiseTimeout unless it gets a result
+        within 'timeout' seconds.
+        '''
+        if self.to_be_released:
+            return
+        self.cancel_timeout()
+        self.timeout_timer = self.conn.timers.call_later(timeout,
+                                                         self._on_timeout)
+
+    def cancel_timeout(self):
+        if self.timeout_timer is not None:
+            self.timeout_timer.cancel()
+            self.timeout_timer = None
+
+    def _on_timeout(self):
+        self.timeout_timer = None
+        result = exceptions.mark_frame(spec.Frame(), exceptions.PromiseTimeout(
+                'Promise %i timed out' % (self.number,)))
+        if self.on_timeout is not None:
+            self.on_timeout(self, result)
+        if self.to_be_released:
+            return
+        if self.channel is not None and self.channel.number != 0:
+            # The broker may still answer, we can't reuse the channel.
+            ChannelReaper(self.conn, self.channel)
+            self.channel = None
+        self.done(result)
+
     def refcnt_inc(self):
         self.refcnt += 1
 
@@ -169,3 +232,30 @@ class Promise(object):
             print("Unable to free channel %i (promise %i)" % \
                 (self.channel.number, self.number))
         self.number = None
+
+
+class ChannelReaper(object):
+    '''
+    Takes over the channel of a timed out promise. The channel gets
+    closed, late replies are dropped and the channel number is reused
+    only after the broker confirms the close.
+    '''
+    body_sink = None
+    body_view = False
+
+    def __init__(self, conn, channel):
+        self.conn = conn
+        self.channel = channel
+        channel.promise = self
+        channel.alive = False
+        conn._send_frames(channel.number,
+                          spec.encode_channel_close(200, '', 0, 0))
+
+    def recv_method(self, result):
+        if result.method_id == spec.METHOD_CHANNEL_CLOSE:
+            # Closed by the broker at the same time.
+            self.conn._send_frames(self.channel.number,
+                                   spec.encode_channel_close_ok())
+        elif result.method_id != spec.METHOD_CHANNEL_CLOSE_OK:
+            return
+        self.conn.channels.deallocate(self.channel)
@@ -0,0 +1,237 @@
+'''
+Selector engines used to wait for socket readiness.
+
+Every engine keeps a map of registered descriptors, each bound to a
+handler object exposing on_read() and on_write(). A descriptor is
+registered once, afterwards only the interest in writability is
+toggled with modify(). poll() returns a list of (handler, readable,
+writable) tuples, an empty list means the timeout expired.
+'''
+
+from __future__ import absolute_import
+
+import errno
+import math
+import os
+import select
+import socket
+
+
+class EpollSelector(object):
+    # Descriptors can be registered from other threads, even while
+    # another one is in poll().
+    threadsafe = True
+
+    def __init__(self):
+        self._epoll = select.epoll()
+        self._handlers = {}
+
+    def register(self, fd, handler, write=False):
+        self._epoll.register(fd, self._mask(write))
+        self._handlers[fd] = handler
+
+    def modify(self, fd, write):
+        self._epoll.modify(fd, self._mask(write))
+
+    def unregister(self, fd):
+        del self._handlers[fd]
+        try:
+            self._epoll.unregister(fd)
+        except (IOError, OSError, ValueError):
+            # Descriptor may be already closed.
+            pass
+
+    def poll(self, timeout=None):
+        if timeout is None:
+            timeout = -1
+        handlers = self._handlers
+        return [(handlers[fd],
+                 bool(ev & (select.EPOLLIN | select.EPOLLPRI |
+                            select.EPOLLERR | select.EPOLLHUP)),
+                 bool(ev & select.EPOLLOUT))
+                for fd, ev in self._epoll.poll(timeout)
+                if fd in handlers]
+
+    def close(self):
+        self._epoll.close()
+
+    def __len__(self):
+        return len(self._handlers)
+
+    @staticmethod
+    def _mask(write):
+        mask = select.EPOLLIN | select.EPOLLPRI
+        if write:
+            mask |= select.EPOLLOUT
+        return mask
+
+
+class PollSelector(object):
+    threadsafe = False
+
+    def __init__(self):
+        self._poll = select.poll()
+        self._handlers = {}
+
+    def register(self, fd, handler, write=False):
+        self._poll.register(fd, self._mask(write))
+        self._handlers[fd] = handler
+
+    def modify(self, fd, write):
+        self._poll.modify(fd, self._mask(write))
+
+    def unregister(self, fd):
+        del self._handlers[fd]
+        try:
+            self._poll.unregister(fd)
+        except KeyError:
+            pass
+
+    def poll(self, timeout=None):
+        if timeout is not None:
+            # poll() counts in milliseconds, round up to avoid busy looping.
+            timeout = int(math.ceil(timeout * 1000))
+        handlers = self._handlers
+        return [(handlers[fd],
+                 bool(ev & (select.POLLIN | select.POLLPRI | select.POLLERR |
+                            select.POLLHUP | select.POLLNVAL)),
+                 bool(ev & select.POLLOUT))
+                for fd, ev in self._poll.poll(timeout)
+                if fd in handlers]
+
+    def close(self):
+        pass
+
+    def __len__(self):
+        return len(self._handlers)
+
+    @staticmethod
+    def _mask(write):
+        mask = select.POLLIN | select.POLLPRI
+        if write:
+            mask |= select.POLLOUT
+        return mask
+
+
+class SelectSelector(object):
+    threadsafe = False
+
+    def __init__(self):
+        self._handlers = {}
+        self._wfds = set()
+
+    def register(self, fd, handler, write=False):
+        self._handlers[fd] = handler
+        self.modify(fd, write)
+
+    def modify(self, fd, write):
+        if write:
+            self._wfds.add(fd)
+        else:
+            self._wfds.discard(fd)
+
+    def unregister(self, fd):
+        del self._handlers[fd]
+        self._wfds.discard(fd)
+
+    def poll(self, timeout=None):
+        handlers = self._handlers
+        rfds = list(handlers)
+        r, w, e = select.select(rfds, list(self._wfds), rfds, timeout)
+        r = set(r) | set(e)
+        w = set(w)
+        return [(handlers[fd], fd in r, fd in w)
+                for fd in r | w
+                if fd in handlers]
+
+    def close(self):
+        pass
+
+    def __len__(self):
+        return len(self._handlers)
+
+
+class Waker(object):
+    '''
+    Handler waking up a poll() from other threads. wake() may be called
+    from any thread, on_read() then runs 'callback' in the polling one.
+    An eventfd is used where available, a socket pair otherwise. Wake
+    ups not handled yet are coalesced, wake() costs a syscall only when
+    the waker isn't already readable.
+    '''
+    def __init__(self, callback):
+        self.callback = callback
+        self._pending = False
+        if hasattr(os, 'eventfd'):
+            self._eventfd = os.eventfd(0, os.EFD_NONBLOCK | os.EFD_CLOEXEC)
+            self._rsd = self._wsd = None
+        else:
+            self._eventfd = None
+            self._rsd, self._wsd = socket.socketpair()
+            self._rsd.setblocking(False)
+            self._wsd.setblocking(False)
+
+    def fileno(self):
+        if self._eventfd is not None:
+            return self._eventfd
+        return self._rsd.fileno()
+
+    def wake(self):
+        if self._pending:
+            return
+        self._pending = True
+        try:
+            if self._eventfd is not None:
+                os.eventfd_write(self._eventfd, 1)
+            else:
+                self._wsd.send(b'\x00')
+        except (OSError, IOError, socket.error) as e:
+            # Full, so there's a wake up waiting anyway.
+            if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                raise
+
+    def on_read(self):
+        self._drain()
+        # Cleared only after the drain, or a wake() racing with it
+        # would be swallowed and leave the flag set for good. A wake()
+        # skipped before this point is handled by the callback below.
+        self._pending = False
+        self.callback()
+
+    def _drain(self):
+        try:
+            if self._eventfd is not None:
+                os.eventfd_read(self._eventfd)
+            else:
+                while self._rsd.recv(4096):
+                    pass
+        except (OSError, IOError, socket.error) as e:
+            if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                raise
+
+    def on_write(self):
+        pass
+
+    def close(self):
+        # Only once no other thread may call wake().
+        if self._eventfd is not None:
+            os.close(self._eventfd)
+            self._eventfd = None
+        elif self._rsd is not None:
+            self._rsd.close()
+            self._wsd.close()
+            self._rsd = self._wsd = None
+
+    def __del__(self):
+        self.close()
+
+
+def default_selector():
+    '''
+    Pick the best engine available on this platform.
+    '''
+    if hasattr(select, 'epoll'):
+        return EpollSelector()
+    if hasattr(select, 'poll'):
+        return PollSelector()
+    return SelectSelector()
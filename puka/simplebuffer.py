@@ -1,87 +1,119 @@
 from __future__ import absolute_import
 from builtins import object
-import future.utils as futils
 
+import collections
+import itertools
 import os
 
-if futils.PY2:
-    try:
-        from cStringIO import StringIO
-    except ImportError:
-        from StringIO import StringIO
-else:
-    from io import BytesIO as StringIO
+from .compat import as_bytes
 
-from .compat import as_bytes, as_str
 
-# Python 2.4 support: os lacks SEEK_END and friends
+# Maximum number of iovec entries accepted by sendmsg().
 try:
-    getattr(os, "SEEK_END")
-except AttributeError:
-    os.SEEK_SET, os.SEEK_CUR, os.SEEK_END = list(range(3))
+    IOV_MAX = os.sysconf('SC_IOV_MAX')
+except (AttributeError, ValueError, OSError):
+    IOV_MAX = 1024
+if IOV_MAX <= 0:
+    IOV_MAX = 1024
 
 
-class SimpleBuffer(object):
+class ChunkedBuffer(object):
     """
-    >>> b = SimpleBuffer()
+    Buffer kept as a deque of chunks. Appending and consuming are O(1)
+    and never copy data, memory is released as soon as a chunk is
+    consumed. Chunks can be flushed with a single vectored write.
+
+    >>> b = ChunkedBuffer()
     >>> b.write('abcdef')
     >>> b.read(3)
     'abc'
     >>> b.consume(3)
-    >>> b.write('z')
+    >>> b.write(memoryview(b'z'))
     >>> b.read()
     'defz'
     >>> b.read()
     'defz'
     >>> b.read(0)
     ''
+    >>> b.peek(2).tobytes()
+    'de'
+    >>> b.peek(4)
+    'defz'
+    >>> len(b.iovec())
+    2
     >>> repr(b)
-    "<SimpleBuffer of 4 bytes, 7 total size, 'defz'>"
-    >>> str(b)
-    "<SimpleBuffer of 4 bytes, 7 total size, 'defz'>"
+    "<ChunkedBuffer of 4 bytes in 2 chunks, 'defz'>"
     >>> len(b)
     4
     >>> bool(b)
     True
+    >>> b.write(b'')
     >>> b.flush()
-    >>> len(b)
-    0
+    >>> len(b), len(b.iovec())
+    (0, 0)
     >>> bool(b)
     False
     >>> b.read(1)
     ''
-    >>> b.write('a'*524288)
-    >>> b.flush() # run GC code
     """
     def __init__(self):
-        self.buf = StringIO()
+        self.chunks = collections.deque()
         self.size = 0
-        self.offset = 0
 
     def write(self, data):
-        data = as_bytes(data)
-        self.buf.write(data)
-        self.size += len(data)
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            data = as_bytes(data)
+        if len(data):
+            self.chunks.append(data)
+            self.size += len(data)
+
+    def iovec(self, max_count=IOV_MAX):
+        return list(itertools.islice(self.chunks, max_count))
+
+    def peek(self, size):
+        """
+        Return up to 'size' bytes from the front. If they fit in the
+        first chunk a memoryview is returned, otherwise small chunks get
+        copied.
+        """
+        if not self.chunks:
+            return b''
+        first = self.chunks[0]
+        if len(first) >= size or len(self.chunks) == 1:
+            return memoryview(first)[:size]
+        pieces = []
+        for chunk in self.chunks:
+            if size <= len(chunk):
+                pieces.append(memoryview(chunk)[:size].tobytes())
+                break
+            pieces.append(chunk if isinstance(chunk, bytes)
+                          else memoryview(chunk).tobytes())
+            size -= len(chunk)
+        return b''.join(pieces)
 
     def read(self, size=None):
-        self.buf.seek(self.offset)
-
+        """
+        Copy up to 'size' bytes from the front, all if 'size' is None.
+        """
         if size is None:
-            data = self.buf.read()
-        else:
-            data = self.buf.read(size)
-
-        self.buf.seek(0, os.SEEK_END)
+            size = self.size
+        data = self.peek(size)
+        if isinstance(data, memoryview):
+            data = data.tobytes()
         return data
 
     def consume(self, size):
-        self.offset += size
         self.size -= size
-        # GC old StringIO instance and free memory used by it.
-        if self.size == 0 and self.offset > 524288:
-            self.buf.close()
-            self.buf = StringIO()
-            self.offset = 0
+        chunks = self.chunks
+        while size:
+            chunk = chunks[0]
+            if size >= len(chunk):
+                chunks.popleft()
+                size -= len(chunk)
+            else:
+                # Partial consume, drop the head without copying the rest.
+                chunks[0] = memoryview(chunk)[size:]
+                size = 0
 
     def flush(self):
         self.consume(self.size)
@@ -96,6 +128,107 @@ class SimpleBuffer(object):
         return self.__repr__()
 
     def __repr__(self):
-        return '<SimpleBuffer of %i bytes, %i total size, %r%s>' % \
-                    (self.size, self.size + self.offset, self.read(16),
+        return '<ChunkedBuffer of %i bytes in %i chunks, %r%s>' % \
+                    (self.size, len(self.chunks), self.read(16),
                      (self.size > 16) and '...' or '')
+
+
+class RecvBuffer(object):
+    """
+    Receive buffer filled straight from the socket with recv_into().
+    Unread data is kept in a single bytearray, so frames can be parsed
+    from a memoryview without copying. The storage is reused between
+    reads and compacted only when we run out of space at the end.
+    Once pinned, because views of it were handed out, the storage is
+    never written over again, fresh storage is allocated instead.
+
+    >>> import socket
+    >>> a, b = socket.socketpair()
+    >>> rb = RecvBuffer(8)
+    >>> _ = b.send(b'abcdef')
+    >>> rb.recv_into(a, 4)
+    4
+    >>> rb.view().tobytes()
+    'abcd'
+    >>> rb.consume(3)
+    >>> rb.recv_into(a, 8)
+    2
+    >>> rb.view().tobytes()
+    'def'
+    >>> len(rb), rb.capacity()
+    (3, 9)
+    >>> rb.consume(3)
+    >>> bool(rb)
+    False
+    >>> _ = b.send(b'ghi')
+    >>> rb.recv_into(a, 8)
+    3
+    >>> kept = rb.view()
+    >>> rb.pin()
+    >>> rb.consume(3)
+    >>> _ = b.send(b'jkl')
+    >>> rb.recv_into(a, 8)
+    3
+    >>> kept.tobytes(), rb.view().tobytes()
+    ('ghi', 'jkl')
+    >>> a.close(); b.close()
+    """
+    def __init__(self, initial_size=131072):
+        self.initial_size = initial_size
+        self.buf = bytearray(initial_size)
+        self.start = 0
+        self.end = 0
+        self.pinned = False
+
+    def recv_into(self, sd, size):
+        if len(self.buf) - self.end < size:
+            self._make_room(size)
+        r = sd.recv_into(memoryview(self.buf)[self.end:], size)
+        self.end += r
+        return r
+
+    def _make_room(self, size):
+        unread = self.end - self.start
+        needed = max(unread + size, self.initial_size)
+        if needed <= len(self.buf) < needed * 4 and not self.pinned:
+            # Move unread data to the front, in place.
+            self.buf[:unread] = self.buf[self.start:self.end]
+        else:
+            # Grow, or shrink after a burst, so that the memory we hold
+            # stays bounded even if the buffer never drains. Allocate a
+            # new buffer instead of resizing, there may be memoryviews
+            # pointing to the old one.
+            buf = bytearray(needed)
+            buf[:unread] = self.buf[self.start:self.end]
+            self.buf = buf
+            self.pinned = False
+        self.start, self.end = 0, unread
+
+    def view(self):
+        return memoryview(self.buf)[self.start:self.end]
+
+    def pin(self):
+        '''
+        Data already received stays in place, views of it may be kept
+        for as long as needed.
+        '''
+        self.pinned = True
+
+    def consume(self, size):
+        self.start += size
+        if self.start == self.end:
+            self.start = self.end = 0
+            if len(self.buf) > self.initial_size or self.pinned:
+                # Don't keep memory grabbed by a large burst, nor
+                # write over data that's still referenced.
+                self.buf = bytearray(self.initial_size)
+                self.pinned = False
+
+    def capacity(self):
+        return len(self.buf)
+
+    def __bool__(self):
+        return self.end > self.start
+
+    def __len__(self):
+        return self.end - self.start
@@ -7,7 +7,7 @@ from struct import pack, unpack_from
 import future.utils as futils
 
 from . import table
-from .compat import as_str, join_as_bytes
+from .compat import as_bytes, as_str, join_as_bytes
 
 
 PREAMBLE = b'AMQP\x00\x00\x09\x01'
@@ -882,6 +882,7 @@ def encode_basic_publish(exchange, routing_key, mandatory, immediate, user_heade
     props, headers = split_headers(user_headers, BASIC_PROPS_SET)
     if headers:
         props['headers'] = headers
+    body = as_bytes(body)
     return [ (0x01,
               join_as_bytes((
                 pack('!IHB', METHOD_BASIC_PUBLISH, 0, len(exchange)),
@@ -1080,8 +1081,8 @@ def split_headers(user_headers, properties_set):
 
 def encode_body(body, frame_size):
     limit = frame_size - 7 - 1   # spec is broken...
-    r = []
-    while body:
-        payload, body = body[:limit], body[limit:]
-        r.append( (0x03, payload) )
-    return r
+    if len(body) <= limit:
+        return [(0x03, body)] if len(body) else []
+    # Frames are views into the body, slicing bytes would copy.
+    view = memoryview(body)
+    return [(0x03, view[i:i + limit]) for i in range(0, len(view), limit)]
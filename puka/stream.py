@@ -0,0 +1,122 @@
+'''
+Message bodies published from file objects, mmaps and iterators. Body
+frames are produced lazily, only as the send buffer drains, so the
+whole body is never held in memory.
+'''
+from __future__ import absolute_import
+from builtins import range
+
+import mmap
+import os
+
+import future.utils as futils
+
+from . import compat
+
+
+def is_stream(body):
+    '''
+    Is 'body' published as a stream, rather than a string?
+
+    >>> is_stream(b'abc'), is_stream(u'abc'), is_stream(iter([b'abc']))
+    (False, False, True)
+    '''
+    if isinstance(body, (futils.binary_type, futils.text_type, bytearray,
+                         memoryview)):
+        return False
+    return isinstance(body, mmap.mmap) or hasattr(body, 'read') or \
+        hasattr(body, '__next__') or hasattr(body, 'next')
+
+
+def body_size(body, size=None):
+    '''
+    Size of a streamed body, it goes into the content header before
+    any of the body is sent. Must be given for iterators.
+    '''
+    if size is not None:
+        return size
+    if isinstance(body, mmap.mmap):
+        return len(body)
+    assert hasattr(body, 'fileno'), \
+        "body_size is needed to publish from %r" % (body,)
+    return os.fstat(body.fileno()).st_size - body.tell()
+
+
+def body_frames(body, size, frame_max):
+    '''
+    Generate body frames for 'size' bytes of 'body'.
+
+    >>> frames = body_frames(iter([b'abcde', b'f']), 6, 11)
+    >>> list(frames) == [(3, b'abc'), (3, b'de'), (3, b'f')]
+    True
+
+    Chunks may be any buffer, counted in bytes.
+
+    >>> import array
+    >>> frames = body_frames(iter([array.array('i', [1, 2])]), 8, 12)
+    >>> [len(payload) for _, payload in frames]
+    [4, 4]
+    '''
+    limit = frame_max - 7 - 1
+    if isinstance(body, mmap.mmap):
+        chunks = _buffer_chunks(memoryview(body), limit)
+    elif hasattr(body, 'read'):
+        chunks = _file_chunks(body, size, limit)
+    else:
+        chunks = body
+    left = size
+    for chunk in chunks:
+        chunk = compat.as_bytes(chunk)
+        for i in range(0, len(chunk), limit):
+            payload = chunk[i:i + limit]
+            left -= len(payload)
+            if left < 0:
+                raise StreamError("Body longer than the declared %i bytes"
+                                  % (size,))
+            yield (0x03, payload)
+        if left == 0:
+            return
+    if left:
+        raise StreamError("Body shorter than the declared %i bytes"
+                          % (size,))
+
+
+def _buffer_chunks(view, limit):
+    for i in range(0, len(view), limit):
+        yield view[i:i + limit]
+
+
+def _file_chunks(f, size, limit):
+    while size > 0:
+        chunk = f.read(min(limit, size))
+        if not chunk:
+            return
+        size -= len(chunk)
+        yield chunk
+
+
+class StreamError(ValueError):
+    pass
+
+
+class Stream(object):
+    '''
+    Frames of a message body being streamed on a channel. The
+    connection pulls from 'frames' while its send buffer is short of
+    data. The stream is dropped once its promise is done, unless it's
+    told to 'finish': a body once started can't be cut short. on_done()
+    is called once all the frames are queued.
+    '''
+    finish = False
+    started = False
+    on_done = None
+
+    def __init__(self, promise, frames):
+        self.promise = promise
+        self.channel_number = promise.channel.number
+        self.frames = frames
+        self.active = True
+
+    @property
+    def cancelled(self):
+        return self.promise.to_be_released and not self.finish
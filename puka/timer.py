@@ -0,0 +1,101 @@
+from __future__ import absolute_import
+
+import heapq
+import itertools
+
+from .compat import monotonic
+
+
+class Timer(object):
+    __slots__ = ('deadline', 'callback', 'args', 'cancelled')
+
+    def __init__(self, deadline, callback, args):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+        self.callback = self.args = None
+
+
+class TimerQueue(object):
+    """
+    Heap of timers driven by a monotonic clock. Cancelled timers are
+    dropped lazily, when they reach the top of the heap.
+
+    >>> tq = TimerQueue()
+    >>> fired = []
+    >>> t1 = tq.call_at(10, fired.append, 'a')
+    >>> t2 = tq.call_at(5, fired.append, 'b')
+    >>> t3 = tq.call_at(7, fired.append, 'c')
+    >>> len(tq)
+    3
+    >>> tq.timeout(now=4)
+    1
+    >>> t3.cancel()
+    >>> tq.run(now=8)
+    >>> fired
+    ['b']
+    >>> tq.timeout(now=8)
+    2
+    >>> tq.run(now=10)
+    >>> fired
+    ['b', 'a']
+    >>> tq.timeout(now=10) is None
+    True
+    >>> bool(tq)
+    False
+    """
+    def __init__(self):
+        self._heap = []
+        # Tie breaker, timers with equal deadline fire in FIFO order.
+        self._counter = itertools.count()
+
+    def call_at(self, deadline, callback, *args):
+        timer = Timer(deadline, callback, args)
+        heapq.heappush(self._heap, (deadline, next(self._counter), timer))
+        return timer
+
+    def call_later(self, delay, callback, *args):
+        return self.call_at(monotonic() + delay, callback, *args)
+
+    def _prune(self):
+        heap = self._heap
+        while heap and heap[0][2].cancelled:
+            heapq.heappop(heap)
+
+    def timeout(self, now=None):
+        '''
+        Seconds until the nearest timer is due, None if there are no
+        timers scheduled.
+        '''
+        self._prune()
+        if not self._heap:
+            return None
+        if now is None:
+            now = monotonic()
+        return max(self._heap[0][0] - now, 0)
+
+    def run(self, now=None):
+        '''
+        Run callbacks of all expired timers.
+        '''
+        if now is None:
+            now = monotonic()
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            _, _, timer = heapq.heappop(heap)
+            if not timer.cancelled:
+                callback, args = timer.callback, timer.args
+                timer.cancel()
+                callback(*args)
+
+    def __len__(self):
+        self._prune()
+        return len(self._heap)
+
+    def __bool__(self):
+        return len(self) > 0
+    __nonzero__ = __bool__
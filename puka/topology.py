@@ -0,0 +1,144 @@
+from __future__ import absolute_import
+
+from collections import OrderedDict
+
+from . import spec
+
+
+def _key(arguments):
+    # Argument tables aren't hashable.
+    return repr(sorted(arguments.items()))
+
+
+class Topology(object):
+    '''
+    Record of exchanges, queues and bindings declared on a connection,
+    so that they can be declared again after a reconnect. Queues named
+    by the server get a new name then.
+
+    >>> t = Topology()
+    >>> t.exchange_declare('x', 'fanout', False, False, {})
+    >>> t.queue_declare('amq.gen-1', True, False, True, False, {})
+    >>> t.queue_bind('amq.gen-1', 'x', '', {})
+    >>> t.queue_declare('q', False, True, False, False, {})
+    >>> t.queue_bind('q', 'x', 'a', {})
+    >>> t.queue_bind('q', 'x', 'b', {})
+    >>> t.queue_unbind('q', 'x', 'a', {})
+    >>> [(method, frames[0][0]) for frames, method, _ in t.replay()] == [
+    ...     (spec.METHOD_EXCHANGE_DECLARE_OK, 1),
+    ...     (spec.METHOD_QUEUE_DECLARE_OK, 1),
+    ...     (spec.METHOD_QUEUE_BIND_OK, 1),
+    ...     (spec.METHOD_QUEUE_DECLARE_OK, 1),
+    ...     (spec.METHOD_QUEUE_BIND_OK, 1)]
+    True
+    >>> t.rename_queue('amq.gen-1', 'amq.gen-2')
+    >>> list(t.queues), sorted(key[0] for key in t.queue_bindings)
+    (['q', 'amq.gen-2'], ['amq.gen-2', 'q'])
+    >>> t.exchange_delete('x')
+    >>> t.queue_delete('q')
+    >>> len(t.exchanges), len(t.queues), len(t.queue_bindings)
+    (0, 1, 0)
+    '''
+    def __init__(self):
+        self.exchanges = OrderedDict()
+        self.queues = OrderedDict()
+        self.queue_bindings = OrderedDict()
+        self.exchange_bindings = OrderedDict()
+        # Called with (old_name, new_name) when a queue gets renamed.
+        self.on_rename = None
+
+    def exchange_declare(self, exchange, type, durable, auto_delete,
+                         arguments):
+        self.exchanges[exchange] = (type, durable, auto_delete, arguments)
+
+    def exchange_delete(self, exchange):
+        self.exchanges.pop(exchange, None)
+        for key in list(self.queue_bindings):
+            if key[1] == exchange:
+                del self.queue_bindings[key]
+        for key in list(self.exchange_bindings):
+            if exchange in key[:2]:
+                del self.exchange_bindings[key]
+
+    def queue_declare(self, queue, server_named, durable, exclusive,
+                      auto_delete, arguments):
+        self.queues[queue] = (server_named, durable, exclusive, auto_delete,
+                              arguments)
+
+    def queue_delete(self, queue):
+        self.queues.pop(queue, None)
+        for key in list(self.queue_bindings):
+            if key[0] == queue:
+                del self.queue_bindings[key]
+
+    def queue_bind(self, queue, exchange, routing_key, arguments):
+        key = (queue, exchange, routing_key, _key(arguments))
+        self.queue_bindings[key] = arguments
+
+    def queue_unbind(self, queue, exchange, routing_key, arguments):
+        key = (queue, exchange, routing_key, _key(arguments))
+        self.queue_bindings.pop(key, None)
+
+    def exchange_bind(self, destination, source, routing_key, arguments):
+        key = (destination, source, routing_key, _key(arguments))
+        self.exchange_bindings[key] = arguments
+
+    def exchange_unbind(self, destination, source, routing_key, arguments):
+        key = (destination, source, routing_key, _key(arguments))
+        self.exchange_bindings.pop(key, None)
+
+    def rename_queue(self, old, new):
+        if old == new:
+            return
+        self.queues[new] = self.queues.pop(old)
+        for key in list(self.queue_bindings):
+            if key[0] == old:
+                arguments = self.queue_bindings.pop(key)
+                self.queue_bindings[(new,) + key[1:]] = arguments
+        if self.on_rename is not None:
+            self.on_rename(old, new)
+
+    def replay(self):
+        '''
+        List of (frames, reply method, callback) to declare everything
+        again. All of it is meant to be sent on a single channel in one
+        go, the broker answers in order. Bindings follow their queue,
+        a server named queue is bound as '' - the last queue declared
+        on the channel.
+        '''
+        steps = []
+        for exchange, (type, durable, auto_delete, arguments) in \
+                self.exchanges.items():
+            steps.append((spec.encode_exchange_declare(
+                        exchange, type, False, durable, auto_delete, False,
+                        arguments),
+                          spec.METHOD_EXCHANGE_DECLARE_OK, None))
+
+        bindings = OrderedDict()
+        for key, arguments in self.queue_bindings.items():
+            bindings.setdefault(key[0], []).append((key, arguments))
+        for queue, (server_named, durable, exclusive, auto_delete,
+                    arguments) in self.queues.items():
+            name = '' if server_named else queue
+            steps.append((spec.encode_queue_declare(
+                        name, False, durable, exclusive, auto_delete,
+                        arguments),
+                          spec.METHOD_QUEUE_DECLARE_OK,
+                          self._renamer(queue) if server_named else None))
+            for (_, exchange, routing_key, _), arguments in \
+                    bindings.get(queue, ()):
+                steps.append((spec.encode_queue_bind(
+                            name, exchange, routing_key, arguments),
+                              spec.METHOD_QUEUE_BIND_OK, None))
+
+        for (destination, source, routing_key, _), arguments in \
+                self.exchange_bindings.items():
+            steps.append((spec.encode_exchange_bind(
+                        destination, source, routing_key, arguments),
+                          spec.METHOD_EXCHANGE_BIND_OK, None))
+        return steps
+
+    def _renamer(self, old):
+        def rename(result):
+            self.rename_queue(old, result['queue'])
+        return rename
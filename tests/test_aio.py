@@ -0,0 +1,69 @@
+import sys
+import unittest
+
+import base
+
+if sys.version_info >= (3, 5):
+    import asyncio
+    from puka import aio
+
+
+@unittest.skipIf(sys.version_info < (3, 5), 'asyncio integration needs py3.5+')
+class TestAsyncClient(base.TestCase):
+    def run_async(self, coro):
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coro)
+        finally:
+            loop.close()
+
+    def test_simple_roundtrip(self):
+        async def main():
+            client = aio.AsyncClient(self.amqp_url)
+            await client.connect()
+            await client.queue_declare(queue=self.name)
+            try:
+                await client.basic_publish(exchange='', routing_key=self.name,
+                                           body=self.msg)
+                result = await client.basic_get(queue=self.name)
+                self.assertEqual(result['body'], self.msg.encode())
+                client.basic_ack(result)
+            finally:
+                await client.queue_delete(queue=self.name)
+                await client.close()
+        self.run_async(main())
+
+    def test_consume_iterator(self):
+        async def main():
+            client = aio.AsyncClient(self.amqp_url)
+            await client.connect()
+            await client.queue_declare(queue=self.name)
+            try:
+                for i in range(3):
+                    await client.basic_publish(exchange='',
+                                               routing_key=self.name,
+                                               body=str(i))
+                consumer = client.basic_consume(queue=self.name)
+                bodies = []
+                async for msg in consumer:
+                    client.basic_ack(msg)
+                    bodies.append(msg['body'])
+                    if len(bodies) == 3:
+                        await consumer.cancel()
+                self.assertEqual(bodies, [b'0', b'1', b'2'])
+            finally:
+                await client.queue_delete(queue=self.name)
+                await client.close()
+        self.run_async(main())
+
+    def test_connection_refused(self):
+        async def main():
+            client = aio.AsyncClient('amqp://127.0.0.1:1/')
+            with self.assertRaises(OSError):
+                await client.connect()
+        self.run_async(main())
+
+
+if __name__ == '__main__':
+    import tests
+    tests.run_unittests(globals())
@@ -0,0 +1,122 @@
+import io
+import os
+import select
+
+import puka
+from puka import spec
+
+import base
+
+
+class TestBackpressure(base.TestCase):
+    def test_would_block(self):
+        drained = []
+        client = puka.Client(self.amqp_url, send_high_watermark=1000,
+                             on_drain=lambda: drained.append(True),
+                             publish_backpressure='error')
+        client.wait(client.connect())
+        # Publishes are held until the publishing channel is open.
+        client.wait(client.basic_publish(exchange='', routing_key='',
+                                         body=''))
+        with client.corked():
+            promise1 = client.basic_publish(exchange='', routing_key='',
+                                            body='a' * 2000)
+            self.assertFalse(client.writable)
+            self.assertTrue(client.send_buffer_size > 2000)
+            promise2 = client.basic_publish(exchange='', routing_key='',
+                                            body='b')
+        with self.assertRaises(puka.WouldBlock):
+            client.wait(promise2)
+        client.wait(promise1)
+        self.assertTrue(client.writable)
+        self.assertEqual(drained, [True])
+        self.assertEqual(client.send_buffer_size, 0)
+        self.assertTrue(client.send_buffer_peak > 2000)
+        client.wait(client.close())
+
+    def test_block(self):
+        client = puka.Client(self.amqp_url, send_high_watermark=65536,
+                             publish_backpressure='block')
+        client.wait(client.connect())
+        client.wait(client.queue_declare(queue=self.name))
+        body = 'x' * 10000
+        for i in range(500):
+            promise = client.basic_publish(exchange='', routing_key=self.name,
+                                           body=body)
+        client.wait(promise)
+        # One message over the watermark at most.
+        self.assertTrue(client.send_buffer_peak < 65536 + 11000)
+        client.wait(client.queue_delete(queue=self.name))
+        client.wait(client.close())
+
+    def test_block_reads(self):
+        client = puka.Client(self.amqp_url, send_high_watermark=65536,
+                             publish_backpressure='block',
+                             flush_policy='immediate')
+        client.wait(client.connect())
+        client.wait(client.basic_publish(exchange='', routing_key='',
+                                         body=''))
+        # Leave an open channel behind, so that the declare below is
+        # sent right away rather than after a channel.open round trip.
+        client.wait(client.queue_declare(queue=self.name))
+        declare = client.queue_declare(queue=self.name)
+        # Wait for the reply to arrive, without reading it.
+        select.select([client.sd], [], [], 5)
+        body = 'x' * 10000
+        with client.corked():
+            for i in range(20):
+                promise = client.basic_publish(exchange='',
+                                               routing_key=self.name,
+                                               body=body)
+        # The reply was read while blocked on the send buffer, as
+        # heartbeats and connection.blocked would be.
+        self.assertTrue(declare in client.promises.ready)
+        client.wait(declare)
+        client.wait(promise)
+        client.wait(client.queue_delete(queue=self.name))
+        client.wait(client.close())
+
+    def test_connection_blocked(self):
+        events = []
+        client = puka.Client(self.amqp_url,
+                             on_blocked=lambda reason: events.append(reason),
+                             on_unblocked=lambda: events.append(None))
+        client.wait(client.connect())
+        client.wait(client.queue_declare(queue=self.name))
+        # As if the broker raised a memory alarm.
+        frame = spec.FrameConnectionBlocked()
+        frame['reason'] = 'low on memory'
+        client.x_connection_promise.recv_method(frame)
+        self.assertEqual(client.blocked, 'low on memory')
+
+        promise = client.basic_publish(exchange='', routing_key=self.name,
+                                       body=self.msg)
+        self.assertEqual(client.wait(promise, timeout=0.1), None)
+        self.assertEqual(client.send_buffer_size, 0)
+        # Streamed bodies are held back too.
+        body = os.urandom(500000)
+        stream_promise = client.basic_publish(exchange='',
+                                              routing_key=self.name,
+                                              body=io.BytesIO(body),
+                                              body_size=len(body))
+        self.assertEqual(client.wait(stream_promise, timeout=0.1), None)
+        self.assertEqual(client.send_buffer_size, 0)
+        result = client.wait(client.queue_declare(queue=self.name))
+        self.assertEqual(result['message_count'], 0)
+
+        client.x_connection_promise.recv_method(
+            spec.FrameConnectionUnblocked())
+        client.wait(promise)
+        client.wait(stream_promise)
+        self.assertEqual(events, ['low on memory', None])
+        result = client.wait(client.basic_get(queue=self.name, no_ack=True))
+        self.assertEqual(result['body'], self.msg.encode())
+        result = client.wait(client.basic_get(queue=self.name, no_ack=True))
+        self.assertEqual(result['body'], body)
+        client.wait(client.queue_delete(queue=self.name))
+        client.wait(client.close())
+
+
+if __name__ == '__main__':
+    import tests
+    tests.run_unittests(globals())
@@ -2,6 +2,7 @@ from __future__ import with_statement
 from builtins import range
 import future.utils as futils
 
+import array
 import os
 import puka
 
@@ -24,6 +25,47 @@ class TestBasic(base.TestCase):
         result = client.wait(consume_promise)
         self.assertEqual(result['body'], self.msg)
 
+    @base.connect
+    def test_large_message(self, client):
+        promise = client.queue_declare(queue=self.name)
+        self.cleanup_promise(client.queue_delete, queue=self.name)
+        client.wait(promise)
+
+        # Spans several body frames.
+        body = os.urandom(client.frame_max * 3 + 1)
+        promise = client.basic_publish(exchange='', routing_key=self.name,
+                                       body=body)
+        client.wait(promise)
+
+        result = client.wait(client.basic_get(queue=self.name, no_ack=True))
+        self.assertEqual(result['body'], body)
+        # Handed over without a copy.
+        self.assertTrue(isinstance(result['body'], bytearray))
+
+    @base.connect
+    def test_buffer_body(self, client):
+        promise = client.queue_declare(queue=self.name)
+        self.cleanup_promise(client.queue_delete, queue=self.name)
+        client.wait(promise)
+
+        numbers = array.array('i', range(100000))
+        small = bytearray(b'abc')
+        for body in (numbers, memoryview(small)):
+            client.wait(client.basic_publish(exchange='',
+                                             routing_key=self.name,
+                                             body=body))
+
+        consume_promise = client.basic_consume(queue=self.name, no_ack=True,
+                                               body_view=True)
+        first = client.wait(consume_promise)
+        second = client.wait(consume_promise)
+        # Reading more doesn't write over bodies already delivered.
+        client.wait(client.queue_declare(queue=self.name))
+        self.assertTrue(isinstance(first['body'], memoryview))
+        self.assertTrue(isinstance(second['body'], memoryview))
+        self.assertEqual(first['body'].tobytes(), numbers.tobytes())
+        self.assertEqual(second['body'].tobytes(), b'abc')
+
     def test_simple_roundtrip_with_connection_properties(self):
         props = { 'puka_test': 'blah', 'random_prop': 1234 }
 
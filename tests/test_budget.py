@@ -0,0 +1,86 @@
+import errno
+import socket
+import unittest
+
+import puka
+from puka import connection
+
+
+HEARTBEAT = b'\x08\x00\x00\x00\x00\x00\x00\xce'
+FRAME_MAX = connection.Connection.frame_max
+
+
+class TestBudget(unittest.TestCase):
+    def setUp(self):
+        # A connection that's done the handshake, talking to 'peer'.
+        self.client = client = puka.Client('amqp:///')
+        client.sd, self.peer = socket.socketpair()
+        for sd in (client.sd, self.peer):
+            sd.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 1 << 20)
+            sd.setblocking(False)
+        client._init_buffers()
+        client._handle_read = client._handle_frames
+        client._vectored_writes = False
+        client.on_read = client.on_read_nohandshake
+        client.on_write = client.on_write_nohandshake
+
+    def tearDown(self):
+        self.client.sd.close()
+        self.peer.close()
+
+    def feed(self, size):
+        # Heartbeats, a single read of frame_max bytes ends on a frame.
+        self.peer.sendall(HEARTBEAT * (size // len(HEARTBEAT)))
+
+    def unread(self, sd):
+        size = 0
+        while True:
+            try:
+                r = len(sd.recv(FRAME_MAX))
+            except socket.error as e:
+                self.assertEqual(e.errno, errno.EAGAIN)
+                return size
+            size += r
+
+    def test_read_budget(self):
+        self.client.read_budget = FRAME_MAX
+        self.feed(FRAME_MAX * 2)
+        self.client.on_read()
+        self.assertEqual(self.unread(self.client.sd), FRAME_MAX)
+
+    def test_read_frame_budget(self):
+        self.client.read_frame_budget = 1
+        self.feed(FRAME_MAX * 2)
+        self.client.on_read()
+        self.assertEqual(self.unread(self.client.sd), FRAME_MAX)
+
+    def test_read_drains(self):
+        # Heartbeats are small, lift the frame budget out of the way.
+        self.client.read_frame_budget = 1 << 30
+        self.feed(FRAME_MAX * 3)
+        self.client.on_read()
+        self.assertEqual(self.unread(self.client.sd), 0)
+        self.assertEqual(len(self.client.recv_buf), 0)
+
+    def test_write_budget(self):
+        # A single send() writes at most 128KB.
+        self.client.write_budget = 1
+        self.client.send_buf.write(b'x' * (FRAME_MAX * 2))
+        self.client.on_write()
+        self.assertEqual(len(self.client.send_buf), FRAME_MAX)
+        self.assertEqual(self.unread(self.peer), FRAME_MAX)
+
+    def test_write_drains(self):
+        self.client.write_budget = 1 << 30
+        self.client.send_buf.write(b'x' * (1 << 23))
+        self.client.on_write()
+        self.assertTrue(len(self.client.send_buf) > 0)
+        # Stopped because the socket is full.
+        with self.assertRaises(socket.error) as cm:
+            self.client.sd.send(b'x')
+        self.assertEqual(cm.exception.errno, errno.EAGAIN)
+
+
+if __name__ == '__main__':
+    import tests
+    tests.run_unittests(globals())
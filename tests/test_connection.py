@@ -32,6 +32,76 @@ class TestConnection(base.TestCase):
         with self.assertRaises(socket.error):
             client.wait(promise)
 
+    def test_timers(self):
+        client = puka.Client(self.amqp_url)
+        client.wait(client.connect())
+        fired = []
+        client.timers.call_later(0.02, fired.append, 'b')
+        client.timers.call_later(0.01, fired.append, 'a')
+        client.timers.call_later(0.03, client.loop_break)
+        client.loop(timeout=5)
+        self.assertEqual(fired, ['a', 'b'])
+
+        # Timers run while waiting for a promise too.
+        client.timers.call_later(0.01, fired.append, 'c')
+        self.assertEqual(client.wait([], timeout=0.05), None)
+        self.assertEqual(fired, ['a', 'b', 'c'])
+        client.wait(client.close())
+
+    def test_heartbeat(self):
+        client = puka.Client(self.amqp_url, heartbeat=1)
+        client.wait(client.connect())
+        self.assertTrue(client.heartbeat <= 1)
+        sent = client._last_write
+        client.loop(timeout=1.2)
+        # Idle connection, so we must have sent a heartbeat.
+        self.assertTrue(client._last_write > sent)
+        client.wait(client.close())
+
+    def test_missed_heartbeats(self):
+        client = puka.Client(self.amqp_url, heartbeat=1)
+        client.wait(client.connect())
+        promise = client.queue_declare(queue=self.name, exclusive=True)
+        # Pretend the broker went silent a while ago.
+        client._last_read -= 10
+        client._heartbeat_tick()
+        with self.assertRaises(puka.ConnectionBroken):
+            client.wait(promise)
+
+    @base.connect
+    def test_rtt(self, client):
+        client.wait(client.queue_declare(queue=self.name, exclusive=True))
+        self.assertTrue(client.rtt > 0)
+
+    def test_failover(self):
+        client = puka.Client(['amqp://127.0.0.1:9999/', self.amqp_url])
+        client.wait(client.connect())
+        client.wait(client.queue_declare(queue=self.name, exclusive=True))
+        client.wait(client.close())
+
+    def test_reconnect(self):
+        reconnects = []
+        def on_reconnect(promise, result):
+            reconnects.append(result)
+            client.loop_break()
+
+        client = puka.Client(self.amqp_url, reconnect=True,
+                             reconnect_delay=0.01, on_reconnect=on_reconnect)
+        client.wait(client.connect())
+        promise = client.queue_declare(queue=self.name, exclusive=True)
+        # Drop the connection under the client's feet.
+        client.sd.shutdown(socket.SHUT_RDWR)
+        with self.assertRaises(puka.ConnectionBroken):
+            client.wait(promise)
+
+        client.loop(timeout=5)
+        self.assertEqual(len(reconnects), 1)
+        self.assertTrue('server_properties' in reconnects[0])
+
+        # Same client object, fully working.
+        client.wait(client.queue_declare(queue=self.name, exclusive=True))
+        client.wait(client.close())
+
     # def test_wrong_vhost(self):
     #     client = puka.Client('amqp:///xxxx')
     #     promise = client.connect()
@@ -0,0 +1,49 @@
+import socket
+
+import puka
+import puka.connection
+import puka.connector
+
+import base
+
+
+# TEST-NET-1, RFC 5737. Packets go nowhere, or get refused.
+BLACKHOLE = (socket.AF_INET, socket.SOCK_STREAM, 0, '', ('192.0.2.1', 5672))
+
+
+class TestConnector(base.TestCase):
+    def plant(self, host, addresses):
+        puka.connector._dns_cache[(host, 5672)] = (float('inf'), addresses)
+        self.addCleanup(puka.connector.forget, host, 5672)
+
+    def test_resolve_cached(self):
+        first = puka.connector.resolve('localhost', 5672)
+        self.assertTrue(first)
+        self.assertTrue(puka.connector.resolve('localhost', 5672) is first)
+        puka.connector.forget('localhost', 5672)
+        self.assertFalse(puka.connector.resolve('localhost', 5672) is first)
+
+    def test_race(self):
+        (_, _, _, host, port, _) = puka.connection.parse_amqp_url(
+            self.amqp_url)
+        good = socket.getaddrinfo(host, port, socket.AF_INET,
+                                  socket.SOCK_STREAM)
+        self.plant('eyeballs.test', [BLACKHOLE] + good)
+
+        client = puka.Client('amqp://eyeballs.test/', connect_timeout=5)
+        client.wait(client.connect())
+        self.assertEqual(client.sd.getpeername()[1], port)
+        client.wait(client.close())
+
+    def test_connect_timeout(self):
+        self.plant('blackhole.test', [BLACKHOLE])
+
+        client = puka.Client('amqp://blackhole.test/', connect_timeout=0.3)
+        with self.assertRaises(socket.error):
+            client.wait(client.connect())
+        self.assertEqual(client.sd, None)
+
+
+if __name__ == '__main__':
+    import tests
+    tests.run_unittests(globals())
@@ -0,0 +1,51 @@
+import puka
+
+import base
+
+
+class TestFlushPolicy(base.TestCase):
+    def _client(self, **kwargs):
+        self.client = client = puka.Client(self.amqp_url, **kwargs)
+        client.wait(client.connect())
+        client.wait(client.queue_declare(queue=self.name))
+        self.cleanup_promise(client.queue_delete, queue=self.name)
+        return client
+
+    def test_immediate(self):
+        client = self._client(flush_policy='immediate')
+        promise = client.basic_publish(exchange='', routing_key=self.name,
+                                       body=self.msg)
+        # Written straight away, without waiting.
+        self.assertFalse(client.needs_write())
+        client.wait(promise)
+        self.run_cleanup_promises()
+
+    def test_linger(self):
+        client = self._client(flush_policy='linger', linger_time=0.01,
+                              linger_bytes=1024*1024)
+        promise = client.basic_publish(exchange='', routing_key=self.name,
+                                       body=self.msg)
+        # Held back until the linger time passes.
+        self.assertFalse(client.needs_write())
+        self.assertTrue(len(client.send_buf) > 0)
+        client.wait(promise, timeout=5)
+        self.assertEqual(len(client.send_buf), 0)
+        self.run_cleanup_promises()
+
+    def test_corked(self):
+        client = self._client(flush_policy='immediate')
+        with client.corked():
+            promises = [client.basic_publish(exchange='',
+                                             routing_key=self.name,
+                                             body=self.msg)
+                        for i in range(10)]
+            self.assertTrue(len(client.send_buf) > 0)
+        self.assertEqual(len(client.send_buf), 0)
+        for promise in promises:
+            client.wait(promise)
+        self.run_cleanup_promises()
+
+
+if __name__ == '__main__':
+    import tests
+    tests.run_unittests(globals())
@@ -0,0 +1,77 @@
+import socket
+
+import puka
+
+import base
+
+
+class TestHub(base.TestCase):
+    def test_timers_and_ready_callbacks(self):
+        hub = puka.Hub()
+        fired = []
+        hub.call_later(0.01, fired.append, 'later')
+        hub.call_later(0.02, hub.loop_break)
+        hub.call_soon(fired.append, 'soon')
+        hub.loop(timeout=5)
+        self.assertEqual(fired, ['soon', 'later'])
+
+    def test_loop_timeout(self):
+        hub = puka.Hub()
+        hub.loop(timeout=0.01)
+
+    def test_many_clients(self):
+        clients = [puka.Client(self.amqp_url) for i in range(4)]
+        for client in clients:
+            client.wait(client.connect())
+
+        hub = puka.Hub(clients)
+        qname = self.name
+        received = []
+
+        def on_message(promise, result):
+            received.append(result['body'])
+            if len(received) == len(clients):
+                hub.loop_break()
+
+        clients[0].wait(clients[0].queue_declare(queue=qname))
+        try:
+            clients[0].basic_consume(queue=qname, no_ack=True,
+                                     callback=on_message)
+            for client in clients:
+                client.basic_publish(exchange='', routing_key=qname,
+                                     body=self.msg)
+            hub.loop(timeout=5)
+            self.assertEqual(len(received), len(clients))
+
+            hub.remove(clients[0])
+            clients[0].wait(clients[0].queue_delete(queue=qname))
+        finally:
+            for client in clients:
+                client.wait(client.close())
+
+    def test_waker_of_disconnected_client(self):
+        client = puka.Client(self.amqp_url, reconnect=True,
+                             reconnect_delay=60)
+        client.wait(client.connect())
+        fired = []
+        client.call_soon_threadsafe(fired.append, 'a')
+        client.wait([], timeout=0.01)
+        self.assertEqual(fired, ['a'])
+
+        # Waiting to reconnect, the waker stays in the client selector.
+        client.sd.shutdown(socket.SHUT_RDWR)
+        client.loop(timeout=0.1)
+        self.assertFalse(client._io_active())
+
+        hub = puka.Hub([client])
+        client.call_soon_threadsafe(fired.append, 'b')
+        client.call_soon_threadsafe(hub.loop_break)
+        hub.loop(timeout=5)
+        self.assertEqual(fired, ['a', 'b'])
+        hub.remove(client)
+        self.assertEqual(len(hub.selector), 0)
+
+
+if __name__ == '__main__':
+    import tests
+    tests.run_unittests(globals())
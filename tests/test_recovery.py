@@ -0,0 +1,123 @@
+import socket
+
+import puka
+
+import base
+
+
+class TestRecovery(base.TestCase):
+    def reconnect(self, client):
+        reconnects = []
+        def on_reconnect(promise, result):
+            reconnects.append(result)
+            client.loop_break()
+        client.on_reconnect = on_reconnect
+        # Drop the connection under the client's feet.
+        client.sd.shutdown(socket.SHUT_RDWR)
+        client.loop(timeout=5)
+        self.assertEqual(len(reconnects), 1)
+
+    def test_consumer_recovery(self):
+        client = puka.Client(self.amqp_url, reconnect=True,
+                             reconnect_delay=0.01)
+        client.wait(client.connect())
+        client.wait(client.queue_declare(queue=self.name, auto_delete=True))
+        self.assertTrue(self.name in client.topology.queues)
+
+        client.wait(client.basic_publish(exchange='', routing_key=self.name,
+                                         body='a'))
+        consume_promise = client.basic_consume(queue=self.name,
+                                               prefetch_count=1)
+        old = client.wait(consume_promise)
+        self.assertEqual(old['body'], b'a')
+
+        self.reconnect(client)
+
+        # The old message can be acked, it's silently dropped.
+        client.basic_ack(old)
+
+        client.wait(client.basic_publish(exchange='', routing_key=self.name,
+                                         body='b'))
+        result = client.wait(consume_promise)
+        while result['body'] == b'a':
+            # Redelivered by the broker.
+            client.basic_ack(result)
+            result = client.wait(consume_promise)
+        self.assertEqual(result['body'], b'b')
+        self.assertTrue(result['delivery_tag'] > old['delivery_tag'])
+        client.basic_ack(result)
+
+        client.wait(client.basic_cancel(consume_promise))
+        client.wait(client.queue_delete(queue=self.name))
+        self.assertFalse(self.name in client.topology.queues)
+        client.wait(client.close())
+
+    def test_server_named_queue(self):
+        client = puka.Client(self.amqp_url, reconnect=True,
+                             reconnect_delay=0.01)
+        client.wait(client.connect())
+        result = client.wait(client.queue_declare(exclusive=True))
+        old_name = result['queue']
+        consume_promise = client.basic_consume(queue=old_name, no_ack=True)
+
+        self.reconnect(client)
+        # The queue is declared again, under a new name.
+        for i in range(100):
+            if old_name not in client.topology.queues:
+                break
+            client.wait([], timeout=0.05)
+        [new_name] = list(client.topology.queues)
+        self.assertNotEqual(new_name, old_name)
+
+        client.wait(client.basic_publish(exchange='', routing_key=new_name,
+                                         body='c'))
+        result = client.wait(consume_promise)
+        self.assertEqual(result['body'], b'c')
+        client.wait(client.close())
+
+    def test_calls_while_disconnected(self):
+        client = puka.Client(self.amqp_url, reconnect=True,
+                             reconnect_delay=60)
+        client.wait(client.connect())
+        client.wait(client.queue_declare(queue=self.name, auto_delete=True))
+        client.wait(client.basic_publish(exchange='', routing_key=self.name,
+                                         body='a'))
+        consume_promise = client.basic_consume(queue=self.name)
+        old = client.wait(consume_promise)
+
+        client.sd.shutdown(socket.SHUT_RDWR)
+        client.loop(timeout=0.1)
+        self.assertFalse(client._io_active())
+
+        # Promises fail, nothing raises from inside puka.
+        with self.assertRaises(puka.ConnectionBroken):
+            client.wait(client.queue_declare(queue=self.name))
+        with self.assertRaises(puka.ConnectionBroken):
+            client.wait(client.basic_publish(exchange='',
+                                             routing_key=self.name,
+                                             body='b'))
+        client.basic_ack(old)
+
+        # Don't wait for the backoff.
+        client._reconnect_timer.cancel()
+        client._reconnect()
+        # Until the connection is open again.
+        with self.assertRaises(puka.ConnectionBroken):
+            client.wait(client.queue_declare(queue=self.name))
+        client.on_reconnect = lambda promise, result: client.loop_break()
+        client.loop(timeout=5)
+
+        client.wait(client.basic_publish(exchange='', routing_key=self.name,
+                                         body='c'))
+        result = client.wait(consume_promise)
+        while result['body'] == b'a':
+            client.basic_ack(result)
+            result = client.wait(consume_promise)
+        self.assertEqual(result['body'], b'c')
+        client.basic_ack(result)
+        client.wait(client.close())
+
+
+if __name__ == '__main__':
+    import tests
+    tests.run_unittests(globals())
@@ -0,0 +1,106 @@
+import select
+import socket
+import threading
+import unittest
+
+from puka import selector
+
+
+class Handler(object):
+    def __init__(self, sd):
+        self.sd = sd
+
+
+class SelectorMixin(object):
+    def setUp(self):
+        self.a, self.b = socket.socketpair()
+        self.a.setblocking(False)
+        self.sel = self.selector_class()
+        self.h = Handler(self.a)
+
+    def tearDown(self):
+        self.sel.close()
+        self.a.close()
+        self.b.close()
+
+    def test_timeout(self):
+        self.sel.register(self.a.fileno(), self.h)
+        self.assertEqual(self.sel.poll(0), [])
+        self.assertEqual(self.sel.poll(0.01), [])
+
+    def test_readable(self):
+        self.sel.register(self.a.fileno(), self.h)
+        self.b.send(b'x')
+        self.assertEqual(self.sel.poll(1), [(self.h, True, False)])
+
+    def test_modify_write(self):
+        self.sel.register(self.a.fileno(), self.h, write=True)
+        self.assertEqual(self.sel.poll(1), [(self.h, False, True)])
+        self.sel.modify(self.a.fileno(), False)
+        self.assertEqual(self.sel.poll(0), [])
+
+    def test_unregister(self):
+        self.sel.register(self.a.fileno(), self.h, write=True)
+        self.assertEqual(len(self.sel), 1)
+        self.sel.unregister(self.a.fileno())
+        self.assertEqual(len(self.sel), 0)
+        self.b.send(b'x')
+        self.assertEqual(self.sel.poll(0), [])
+
+    def test_waker(self):
+        woken = []
+        waker = selector.Waker(lambda: woken.append(True))
+        self.addCleanup(waker.close)
+        self.sel.register(waker.fileno(), waker)
+        threading.Timer(0.01, waker.wake).start()
+        [(handler, readable, writable)] = self.sel.poll(5)
+        self.assertTrue(handler is waker and readable)
+        handler.on_read()
+        self.assertEqual(woken, [True])
+        self.assertEqual(self.sel.poll(0), [])
+        # Coalesced into a single wake up.
+        waker.wake()
+        waker.wake()
+        [(handler, readable, writable)] = self.sel.poll(0)
+        handler.on_read()
+        self.assertEqual(woken, [True, True])
+        self.assertEqual(self.sel.poll(0), [])
+        self.sel.unregister(waker.fileno())
+
+    def test_waker_race(self):
+        class RacyWaker(selector.Waker):
+            def _drain(self):
+                # Another thread wakes us up while we drain.
+                self.wake()
+                super(RacyWaker, self)._drain()
+        woken = []
+        waker = RacyWaker(lambda: woken.append(True))
+        self.addCleanup(waker.close)
+        self.sel.register(waker.fileno(), waker)
+        waker.wake()
+        [(handler, readable, writable)] = self.sel.poll(0)
+        handler.on_read()
+        self.assertEqual(woken, [True])
+        # Wake ups still get through.
+        waker.wake()
+        self.assertEqual(len(self.sel.poll(0)), 1)
+        self.sel.unregister(waker.fileno())
+
+
+class TestSelectSelector(SelectorMixin, unittest.TestCase):
+    selector_class = selector.SelectSelector
+
+
+@unittest.skipUnless(hasattr(select, 'poll'), 'poll() not available')
+class TestPollSelector(SelectorMixin, unittest.TestCase):
+    selector_class = selector.PollSelector
+
+
+@unittest.skipUnless(hasattr(select, 'epoll'), 'epoll() not available')
+class TestEpollSelector(SelectorMixin, unittest.TestCase):
+    selector_class = selector.EpollSelector
+
+
+if __name__ == '__main__':
+    import tests
+    tests.run_unittests(globals())
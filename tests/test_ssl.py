@@ -0,0 +1,31 @@
+import os
+import unittest
+
+import puka
+
+import base
+
+
+class TestSsl(base.TestCase):
+    def test_context_cached(self):
+        params = puka.SslConnectionParameters()
+        context = params.context
+        self.assertTrue(params.context is context)
+        params.ciphers = 'HIGH'
+        self.assertFalse(params.context is context)
+
+    @unittest.skipUnless(os.getenv('AMQPS_URL'), 'AMQPS_URL not set')
+    def test_session_resumption(self):
+        params = puka.SslConnectionParameters()
+        for i in range(2):
+            client = puka.Client(os.getenv('AMQPS_URL'),
+                                 ssl_parameters=params)
+            client.wait(client.connect())
+            reused = client.sd.session_reused
+            client.wait(client.close())
+        self.assertTrue(reused)
+
+
+if __name__ == '__main__':
+    import tests
+    tests.run_unittests(globals())
@@ -0,0 +1,128 @@
+import array
+import io
+import mmap
+import os
+import tempfile
+
+import puka
+
+import base
+
+
+class TestStream(base.TestCase):
+    def publish(self, client, *bodies):
+        promise = client.queue_declare(queue=self.name)
+        self.cleanup_promise(client.queue_delete, queue=self.name)
+        client.wait(promise)
+        for body in bodies:
+            client.wait(client.basic_publish(exchange='',
+                                             routing_key=self.name,
+                                             body=body))
+
+    @base.connect
+    def test_consume_to_file(self, client):
+        body = os.urandom(client.frame_max * 2 + 7)
+        self.publish(client, body, b'')
+        started = []
+        def sink(msg):
+            started.append(msg)
+            return sinks[len(started) - 1]
+        sinks = [io.BytesIO(), io.BytesIO()]
+
+        consume_promise = client.basic_consume(queue=self.name, no_ack=True,
+                                               body_sink=sink)
+        result = client.wait(consume_promise)
+        self.assertTrue(result is started[0])
+        self.assertEqual(result['body'], None)
+        self.assertEqual(result['body_size'], len(body))
+        self.assertEqual(sinks[0].getvalue(), body)
+
+        result = client.wait(consume_promise)
+        self.assertTrue(result is started[1])
+        self.assertEqual(result['body'], None)
+        self.assertEqual(result['body_size'], 0)
+        self.assertEqual(sinks[1].getvalue(), b'')
+        client.wait(client.basic_cancel(consume_promise))
+
+    @base.connect
+    def test_get_to_fd(self, client):
+        body = os.urandom(client.frame_max + 1)
+        self.publish(client, body)
+        with tempfile.TemporaryFile() as f:
+            result = client.wait(client.basic_get(
+                    queue=self.name, no_ack=True,
+                    body_sink=lambda msg: f.fileno()))
+            self.assertEqual(result['body'], None)
+            f.seek(0)
+            self.assertEqual(f.read(), body)
+
+    @base.connect
+    def test_get_to_generator(self, client):
+        self.publish(client, self.msg)
+        chunks = []
+        def sink():
+            try:
+                while True:
+                    chunk = yield
+                    chunks.append(chunk.tobytes())
+            except GeneratorExit:
+                chunks.append(None)
+
+        result = client.wait(client.basic_get(
+                queue=self.name, no_ack=True,
+                body_sink=lambda msg: sink()))
+        self.assertEqual(result['body'], None)
+        self.assertEqual(chunks, [self.msg.encode(), None])
+
+    @base.connect
+    def test_publish_file(self, client):
+        self.publish(client)
+        body = os.urandom(client.frame_max * 3)
+        with tempfile.TemporaryFile() as f:
+            f.write(body)
+            f.seek(0)
+            big = client.basic_publish(exchange='', routing_key=self.name,
+                                       body=f)
+            # Doesn't wait for the whole body to go out.
+            small = client.basic_publish(exchange='', routing_key=self.name,
+                                         body=self.msg)
+            client.wait(small)
+            client.wait(big)
+
+        result = client.wait(client.basic_get(queue=self.name, no_ack=True))
+        self.assertEqual(result['body'], self.msg.encode())
+        result = client.wait(client.basic_get(queue=self.name, no_ack=True))
+        self.assertEqual(result['body'], body)
+
+    @base.connect
+    def test_publish_mmap_and_iterator(self, client):
+        self.publish(client)
+        m = mmap.mmap(-1, client.frame_max + 1)
+        m.write(os.urandom(len(m)))
+        client.wait(client.basic_publish(exchange='', routing_key=self.name,
+                                         body=m, headers={'x-a': 1}))
+        chunks = [b'a' * 10, b'b' * client.frame_max]
+        client.wait(client.basic_publish(exchange='', routing_key=self.name,
+                                         body=iter(chunks),
+                                         body_size=client.frame_max + 10))
+
+        result = client.wait(client.basic_get(queue=self.name, no_ack=True))
+        self.assertEqual(result['body'], m[:])
+        self.assertEqual(result['headers']['x-a'], 1)
+        result = client.wait(client.basic_get(queue=self.name, no_ack=True))
+        self.assertEqual(result['body'], b''.join(chunks))
+
+    @base.connect
+    def test_publish_iterator_of_arrays(self, client):
+        self.publish(client)
+        chunks = [array.array('i', range(5)), array.array('i', range(5, 10))]
+        client.wait(client.basic_publish(exchange='', routing_key=self.name,
+                                         body=iter(chunks), body_size=40))
+        result = client.wait(client.basic_get(queue=self.name, no_ack=True))
+        self.assertEqual(result['body'],
+                         b''.join(chunk.tobytes() for chunk in chunks))
+
+
+if __name__ == '__main__':
+    import tests
+    tests.run_unittests(globals())
@@ -0,0 +1,71 @@
+import threading
+import time
+
+import puka
+from puka import selector
+
+import base
+
+
+class TestThreadsafe(base.TestCase):
+    @base.connect
+    def test_publish_threadsafe(self, client):
+        client.wait(client.queue_declare(queue=self.name))
+        self.cleanup_promise(client.queue_delete, queue=self.name)
+
+        futures = []
+        def publisher():
+            for i in range(50):
+                futures.append(client.publish_threadsafe(
+                        exchange='', routing_key=self.name, body=self.msg))
+
+        io_thread = threading.Thread(target=client.loop)
+        io_thread.start()
+        try:
+            publishers = [threading.Thread(target=publisher)
+                          for i in range(4)]
+            for thread in publishers:
+                thread.start()
+            for thread in publishers:
+                thread.join()
+            for future in futures:
+                future.result(timeout=5)
+        finally:
+            client.call_soon_threadsafe(client.loop_break)
+            io_thread.join()
+
+        result = client.wait(client.queue_declare(queue=self.name))
+        self.assertEqual(result['message_count'], 200)
+
+    def test_publish_threadsafe_poll(self):
+        # poll() can't watch a new descriptor once it's blocked, the
+        # waker must be there before the first call.
+        client = puka.Client(self.amqp_url, selector=selector.PollSelector())
+        client.wait(client.connect())
+        io_thread = threading.Thread(target=client.loop)
+        io_thread.start()
+        try:
+            # Let the loop go idle.
+            time.sleep(0.1)
+            future = client.publish_threadsafe(exchange='', routing_key='',
+                                               body=self.msg)
+            future.result(timeout=5)
+        finally:
+            client.call_soon_threadsafe(client.loop_break)
+            io_thread.join()
+        client.wait(client.close())
+
+    @base.connect
+    def test_publish_threadsafe_error(self, client):
+        future = client.publish_threadsafe(exchange='', routing_key=self.name,
+                                           mandatory=True, body='')
+        # Handled by whoever runs the loop, even this thread.
+        client.timers.call_later(0.1, client.loop_break)
+        client.loop(timeout=5)
+        with self.assertRaises(puka.NoRoute):
+            future.result(timeout=0)
+
+
+if __name__ == '__main__':
+    import tests
+    tests.run_unittests(globals())
@@ -0,0 +1,92 @@
+import puka
+import puka.promise
+
+import base
+
+
+class TestTimeout(base.TestCase):
+    @base.connect
+    def test_no_timeout(self, client):
+        promise = client.queue_declare(queue=self.name, timeout=5)
+        client.wait(promise)
+        self.cleanup_promise(client.queue_delete, queue=self.name)
+
+        promise = client.basic_publish(exchange='', routing_key=self.name,
+                                       body=self.msg, timeout=5)
+        client.wait(promise)
+
+        # The timer is gone once the result is in.
+        self.assertEqual(len(client.timers), 0)
+
+    @base.connect
+    def test_consume_timeout(self, client):
+        promise = client.queue_declare(queue=self.name)
+        client.wait(promise)
+        self.cleanup_promise(client.queue_delete, queue=self.name)
+
+        # Times out before the channel is even open.
+        consume_promise = client.basic_consume(queue=self.name, timeout=0)
+        channel_number = client.promises.by_number(consume_promise).channel.number
+        with self.assertRaises(puka.PromiseTimeout):
+            client.wait(consume_promise)
+
+        # The promise is released, the channel is closed in the background.
+        self.assertFalse(consume_promise in client.promises._promises)
+        channel = client.channels.channels[channel_number]
+        self.assertTrue(isinstance(channel.promise, puka.promise.ChannelReaper))
+
+        # The connection is fine.
+        promise = client.basic_publish(exchange='', routing_key=self.name,
+                                       body=self.msg)
+        client.wait(promise)
+        promise = client.basic_get(queue=self.name)
+        result = client.wait(promise)
+        self.assertEqual(result['body'], self.msg.encode())
+        client.basic_ack(result)
+
+        # By now the channel was closed and its number may be reused.
+        self.assertFalse(channel is client.channels.channels.get(channel_number))
+
+    @base.connect
+    def test_consume_running(self, client):
+        promise = client.queue_declare(queue=self.name)
+        client.wait(promise)
+        self.cleanup_promise(client.queue_delete, queue=self.name)
+
+        consume_promise = client.basic_consume(queue=self.name, no_ack=True,
+                                               timeout=0.05)
+        # Nothing arrives within the timeout, but the consumer is
+        # already running.
+        client.wait([], timeout=0.1)
+
+        promise = client.basic_publish(exchange='', routing_key=self.name,
+                                       body=self.msg)
+        client.wait(promise)
+        result = client.wait(consume_promise)
+        self.assertEqual(result['body'], self.msg.encode())
+        client.wait(client.basic_cancel(consume_promise))
+
+    def test_callback(self):
+        client = puka.Client(self.amqp_url)
+        client.wait(client.connect())
+        try:
+            client.wait(client.queue_declare(queue=self.name))
+            results = []
+
+            def on_timeout(promise, result):
+                results.append(result)
+                client.loop_break()
+            client.basic_consume(queue=self.name, timeout=0,
+                                 callback=on_timeout)
+            client.loop(timeout=5)
+            self.assertEqual(len(results), 1)
+            self.assertTrue(isinstance(results[0].exception,
+                                       puka.PromiseTimeout))
+            client.wait(client.queue_delete(queue=self.name))
+        finally:
+            client.wait(client.close())
+
+
+if __name__ == '__main__':
+    import tests
+    tests.run_unittests(globals())